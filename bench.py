@@ -0,0 +1,276 @@
+"""In-process benchmarks of the game engine with a deterministic fake model
+
+    python bench.py --sizes 100,10000 --history 10,500 --output bench.json
+    python bench.py --baseline bench.json     # flag regressions against a previous run
+
+Model latency defaults to 0 so the numbers show engine overhead only.
+Startup is measured in fresh interpreters: import time, first /update and
+first verdict of the web app, and the time until the CLI is ready.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Isolate the benchmark from local settings before soup reads its config
+os.environ.update({
+    "CHERRYIN_KEY": "bench",
+    "HTTP_WARMUP": "0",
+    "STATE_DIR": "",
+    "TRAFFIC_LOG": "",
+    "VERDICT_CACHE_SIZE": "0",
+    "CLASSIFIER_ENABLED": "0",
+    "FAQ_INDEX": "",
+    "RATE_LIMIT_SPEAKER": "",
+    "RATE_LIMIT_IP": "",
+    "RATE_LIMIT_ROOM": "",
+    "RATE_LIMIT_GLOBAL": "",
+})
+
+
+# Runs in a fresh interpreter and prints its timings (seconds) as JSON
+WEB_STARTUP_PROBE = """
+import json, time
+started = time.perf_counter()
+from soup.web.app import app
+imported = time.perf_counter()
+client = app.test_client()
+client.post("/update", json={"cmd": "get_info"})
+updated = time.perf_counter()
+from soup.agents.clients import override_model
+from soup.agents.fake_model import create_fake_model
+override_model(create_fake_model())
+client.post("/cmd", json={"cmd": "new_game"})
+client.post("/cmd", json={"cmd": "ask", "content": "他是自杀的吗？"})
+answered = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "first /update": updated - imported,
+    "first verdict": answered - updated,
+}))
+"""
+
+CLI_STARTUP_PROBE = """
+import json, time
+started = time.perf_counter()
+from soup.game import SoupFlow
+SoupFlow()
+print(json.dumps({"cli ready": time.perf_counter() - started}))
+"""
+
+
+def summarize_samples(samples):
+    """Latency stats of samples in microseconds"""
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "mean_us": round(statistics.fmean(samples), 2),
+        "p50_us": round(samples[len(samples) // 2], 2),
+        "p99_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+        "ops_per_s": round(1e6 / statistics.fmean(samples), 1),
+    }
+
+
+def measure(fn, iterations, warmup=5):
+    """Per-call latency stats in microseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return summarize_samples(samples)
+
+
+def write_puzzles(path, size):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(size):
+            f.write(json.dumps({
+                "question": f"第{i}号汤面：一个人走进餐厅点了一碗海龟汤，喝了一口之后就自杀了。",
+                "answer": f"第{i}号汤底：他发现之前喝的并不是真正的海龟汤。",
+                "tags": ["bench", f"group{i % 10}"],
+                "difficulty": i % 5,
+            }, ensure_ascii=False) + "\n")
+
+
+def run_suite(args):
+    from soup.agents.clients import override_model
+    from soup.agents.fake_model import create_fake_model
+    from soup.config import config, logger
+    from soup.game import SoupFlow, SoupResources
+    from soup.rooms import RoomManager
+
+    logger.remove()
+    override_model(create_fake_model(latency=args.latency_ms / 1000))
+    from soup.web import app as web
+    # Through the environment: SoupResources reloads the config from it
+    saved_env = {name: os.environ.get(name) for name in ("CHAT_RETENTION", "SOUP_FILE")}
+    os.environ["CHAT_RETENTION"] = str(max(args.history) + 1)
+
+    results = []
+
+    def record(name, params, stats):
+        results.append({"name": name, "params": params, **stats})
+        print(f"{name:<16} {json.dumps(params):<34} mean {stats['mean_us']:>10.1f}us  p99 {stats['p99_us']:>10.1f}us")
+
+    tmpdir = tempfile.mkdtemp(prefix="soup-bench-")
+    client = web.app.test_client()
+
+    for size in args.sizes:
+        soup_file = os.path.join(tmpdir, f"soups-{size}.jsonl")
+        write_puzzles(soup_file, size)
+        os.environ["SOUP_FILE"] = soup_file
+        resources = SoupResources()
+        resources.console.quiet = True
+        assert config.CHAT_RETENTION == max(args.history) + 1
+        assert len(resources.store) == size, f"loaded {len(resources.store)} puzzles instead of {size}"
+        flow = SoupFlow(resources)
+        flow.start_new_game()
+
+        record("start_new_game", {"puzzles": size}, measure(flow.start_new_game, args.iterations))
+
+        counter = iter(range(10 ** 9))
+        record("handle_ask", {"puzzles": size}, measure(
+            lambda: flow.handle_ask(f"他是第{next(counter)}个自杀的吗"), args.iterations
+        ))
+        record("handle_answer", {"puzzles": size}, measure(
+            lambda: flow.handle_answer(f"他发现第{next(counter)}碗汤不是海龟汤"), args.iterations
+        ))
+
+        web.app.rooms = RoomManager(resources)
+        room = web.app.rooms.get("bench")
+        for history in args.history:
+            room.start_new_game()
+            for i in range(history - 1):
+                room.add_message("玩家", f"第{i}条消息：他是自杀的吗？")
+            game_id = room.game_state["game_id"]
+            params = {"puzzles": size, "history": history}
+
+            record("get_new_chats", {**params, "cursor": "new_game"}, measure(
+                lambda: web.get_new_chats(room, -1, 0), args.iterations
+            ))
+            record("get_new_chats", {**params, "cursor": "latest"}, measure(
+                lambda: web.get_new_chats(room, game_id, history), args.iterations
+            ))
+            record("/update", {**params, "cursor": "latest"}, measure(
+                lambda: client.post("/update", json={
+                    "cmd": "get_info", "room": "bench", "game_id": game_id, "chat_id": history,
+                }), args.iterations
+            ))
+            record("/update", {**params, "cursor": "new_game"}, measure(
+                lambda: client.post("/update", json={
+                    "cmd": "get_info", "room": "bench", "game_id": -1, "chat_id": 0,
+                }), args.iterations
+            ))
+
+        record("/cmd ask", {"puzzles": size}, measure(
+            lambda: client.post("/cmd", json={
+                "cmd": "ask", "room": "bench", "content": f"他是第{next(counter)}个自杀的吗",
+            }), args.iterations
+        ))
+        record("/cmd new_game", {"puzzles": size}, measure(
+            lambda: client.post("/cmd", json={"cmd": "new_game", "room": "bench"}), args.iterations
+        ))
+
+    # The startup probes run on the shipped settings again
+    for name, value in saved_env.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    return results
+
+
+def run_startup(args):
+    """Cold-start timings, each probe in `args.startup_runs` fresh interpreters"""
+    results = []
+    # Agents must be built with the fake model, on the probe's own schedule
+    env = dict(os.environ, PRELOAD="0")
+    for mode, probe in (("web", WEB_STARTUP_PROBE), ("cli", CLI_STARTUP_PROBE)):
+        samples = {}
+        for _ in range(args.startup_runs):
+            output = subprocess.check_output(
+                [sys.executable, "-c", probe], env=env, text=True, stderr=subprocess.DEVNULL
+            )
+            for name, seconds in json.loads(output.splitlines()[-1]).items():
+                samples.setdefault(name, []).append(seconds * 1e6)
+        for name, values in samples.items():
+            stats = summarize_samples(values)
+            results.append({"name": f"startup {name}", "params": {"mode": mode}, **stats})
+            print(f"{'startup ' + name:<24} {mode:<26} mean {stats['mean_us'] / 1000:>10.1f}ms  p99 {stats['p99_us'] / 1000:>10.1f}ms")
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, tolerance):
+    """Print benchmarks that got slower than the baseline by more than `tolerance`"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {
+            (r["name"], json.dumps(r["params"], sort_keys=True)): r
+            for r in json.load(f)["results"]
+        }
+
+    regressions = 0
+    for r in results:
+        old = baseline.get((r["name"], json.dumps(r["params"], sort_keys=True)))
+        if old is None:
+            continue
+        ratio = r["p50_us"] / old["p50_us"] if old["p50_us"] else 1.0
+        if ratio > 1 + tolerance:
+            regressions += 1
+            print(f"REGRESSION {r['name']} {r['params']}: p50 {old['p50_us']}us -> {r['p50_us']}us (x{ratio:.2f})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SoupFlow engine and web routes")
+    parser.add_argument("--sizes", default="100,10000", help="Puzzle-set sizes, comma separated")
+    parser.add_argument("--history", default="10,500", help="Chat-history lengths, comma separated")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fake model latency")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters per startup probe (0 skips)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against a previous JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs baseline")
+    args = parser.parse_args()
+    args.sizes = [int(x) for x in args.sizes.split(",")]
+    args.history = [int(x) for x in args.history.split(",")]
+
+    results = run_suite(args)
+    if args.startup_runs:
+        results += run_startup(args)
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "latency_ms": args.latency_ms,
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        sys.exit(1 if compare(results, args.baseline, args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
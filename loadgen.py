@@ -0,0 +1,180 @@
+"""Load generator: simulated players against a running SoupWeb server
+
+    python stub_server.py --latency lognormal:0.0,0.5 &
+    MODEL_BASE_URL=http://127.0.0.1:8900/v1/ RATE_LIMIT_IP= python main.py &
+    python loadgen.py --players 40 --rooms 8 --duration 60 --server-pid $!
+
+Each player polls /update and fires ask/ans commands at its room; one player
+per room starts new games. Reports p50/p99 latency per endpoint, throughput,
+the rate of busy rejections (429 or "AI is processing") and the server's peak RSS.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+QUESTIONS = ["他是自杀的吗", "死者认识凶手吗", "这件事发生在晚上吗", "和天气有关吗", "有第三个人在场吗"]
+ANSWERS = ["他是被熟人杀害的", "她其实一直在说谎", "那是一场意外"]
+BUSY_MSG = "AI is processing"
+BUSY_STATUS = 429
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def read_rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.failures = defaultdict(int)
+        self.busy = 0
+        self.commands = 0
+        self.peak_rss_kb = None
+
+    def record(self, name, seconds, response):
+        with self.lock:
+            self.latency[name].append(seconds)
+            if response is None:
+                self.failures[name] += 1
+            elif name in ("ask", "ans"):
+                self.commands += 1
+                if response.get("status") == BUSY_STATUS or BUSY_MSG in response.get("msg", ""):
+                    self.busy += 1
+
+
+class Player(threading.Thread):
+    def __init__(self, name, base_url, room, stats, stop, think, starter):
+        super().__init__(daemon=True)
+        self.speaker = name
+        self.base_url = base_url.rstrip("/")
+        self.room = room
+        self.stats = stats
+        self.stop = stop
+        self.think = think
+        self.starter = starter
+        self.game_id = -1
+        self.chat_id = 0
+
+    def call(self, name, path, payload):
+        body = json.dumps(dict(payload, room=self.room, speaker=self.speaker)).encode("utf-8")
+        request = urllib.request.Request(
+            self.base_url + path, data=body, headers={"Content-Type": "application/json"}
+        )
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=120) as resp:
+                response = json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            # Backpressure (429) still carries a JSON body
+            try:
+                response = dict(json.loads(e.read()), status=e.code)
+            except ValueError:
+                response = None
+        except (urllib.error.URLError, OSError, ValueError):
+            response = None
+        self.stats.record(name, time.perf_counter() - started, response)
+        return response
+
+    def run(self):
+        rng = random.Random()
+        while not self.stop.is_set():
+            info = self.call("update", "/update",
+                             {"cmd": "get_info", "game_id": self.game_id, "chat_id": self.chat_id})
+            if info and info.get("code") == 0:
+                self.game_id = info.get("game_id", self.game_id)
+                self.chat_id = info.get("chat_id", self.chat_id)
+                if not info.get("current_soup") and self.starter:
+                    self.call("new_game", "/cmd", {"cmd": "new_game"})
+                elif info.get("current_soup"):
+                    if rng.random() < 0.85:
+                        self.call("ask", "/cmd", {"cmd": "ask", "content": rng.choice(QUESTIONS)})
+                    else:
+                        self.call("ans", "/cmd", {"cmd": "ans", "content": rng.choice(ANSWERS)})
+            self.stop.wait(rng.uniform(0.5, 1.5) * self.think)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated players for SoupWeb")
+    parser.add_argument("--url", default="http://127.0.0.1:42345")
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--think", type=float, default=1.0, help="Mean seconds between player actions")
+    parser.add_argument("--server-pid", type=int, help="Sample the server's RSS from /proc")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    stats = Stats()
+    stop = threading.Event()
+    rooms = [f"load-{i}" for i in range(args.rooms)]
+    players = [
+        Player(f"player-{i}", args.url, rooms[i % len(rooms)], stats, stop, args.think, starter=i < len(rooms))
+        for i in range(args.players)
+    ]
+    started = time.perf_counter()
+    for player in players:
+        player.start()
+
+    deadline = started + args.duration
+    while time.perf_counter() < deadline:
+        if args.server_pid:
+            rss = read_rss_kb(args.server_pid)
+            if rss is not None:
+                stats.peak_rss_kb = max(stats.peak_rss_kb or 0, rss)
+        time.sleep(min(1.0, max(0.0, deadline - time.perf_counter())))
+    stop.set()
+    for player in players:
+        player.join(timeout=130)
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "players": args.players,
+        "rooms": args.rooms,
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": {
+            name: {
+                "count": len(values),
+                "failures": stats.failures[name],
+                "rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+            }
+            for name, values in sorted(stats.latency.items())
+        },
+        "busy_rejections": stats.busy,
+        "busy_rate": round(stats.busy / stats.commands, 4) if stats.commands else 0.0,
+        "peak_rss_mb": round(stats.peak_rss_kb / 1024, 1) if stats.peak_rss_kb else None,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.players} players / {args.rooms} rooms, {report['elapsed_s']}s")
+    for name, row in report["endpoints"].items():
+        print(f"  {name:<9} n={row['count']:<6} fail={row['failures']:<4} {row['rps']:>7} req/s"
+              f"  p50={row['p50_ms']:>8}ms  p99={row['p99_ms']:>8}ms")
+    print(f"  busy rejections: {stats.busy} ({report['busy_rate']:.1%} of ask/ans)")
+    if report["peak_rss_mb"] is not None:
+        print(f"  server peak RSS: {report['peak_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
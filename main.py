@@ -1,10 +1,12 @@
 import argparse
-import threading
-from soup.game import SoupFlow
-from soup.web.app import app, Config
 from soup.config import logger, config
 
+# Each mode imports only what it needs: the CLI never loads Flask
+
+
 def run_cli():
+    from soup.game import SoupFlow
+
     flow = SoupFlow()
     while True:
         command = input(
@@ -14,18 +16,35 @@ def run_cli():
 
 
 def run_web():
+    from soup.web.app import app, Config
+
     host = Config.HOST
     port = Config.PORT
     logger.info(f"Starting Kame Soup server on {host}:{port}")
+    # Rooms are ready for the first request; agents and puzzles preload in the background
+    app.rooms
     app.run(host=host, port=port)
 
 
+def run_server(workers):
+    from soup.web.app import app, Config
+    from soup.web.server import serve
+
+    serve(app, Config.HOST, Config.PORT, workers)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--cli", dest="cli", action="store_true", help="Run in CLI mode")
+    parser.add_argument(
+        "--workers", type=int, default=config.WEB_WORKERS,
+        help="Serve from this many worker processes sharing SHARED_DB (0: development server)",
+    )
     args = parser.parse_args()
 
     if args.cli:
         run_cli()
+    elif args.workers > 0:
+        run_server(args.workers)
     else:
         run_web()
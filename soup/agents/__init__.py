@@ -1,7 +1,22 @@
-from .answer_agent import create_answer_agent
-from .judge_agent import create_judge_agent
+"""Agent factories
 
-__all__ = [
-    "create_answer_agent",
-    "create_judge_agent",
-]
+They are imported on first use: building an agent pulls in pydantic-ai and
+the provider SDK, which take about a second to import.
+"""
+from importlib import import_module
+
+_FACTORIES = {
+    "create_answer_agent": ".answer_agent",
+    "create_batch_judge_agent": ".batch_agent",
+    "create_faq_agent": ".faq_agent",
+    "create_judge_agent": ".judge_agent",
+}
+
+__all__ = list(_FACTORIES)
+
+
+def __getattr__(name):
+    module = _FACTORIES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(module, __name__), name)
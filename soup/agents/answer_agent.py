@@ -1,11 +1,9 @@
 from typing import Literal
 
 from pydantic import BaseModel, Field
-from pydantic_ai import Agent
-from pydantic_ai.models.openai import OpenAIChatModel
-from pydantic_ai.providers.openai import OpenAIProvider
 
 from soup.agents.dep import SoupState
+from soup.agents.prompts import puzzle_instructions
 from soup.config import config, logger
 
 ANSWER_JUDGE_SYSTEM_PROMPT = """
@@ -20,6 +18,18 @@ ANSWER_JUDGE_SYSTEM_PROMPT = """
 5. 当你判断用户的输入没有意义、无法理解，直接回答「错误」。
 """.strip()
 
+ANSWER_PUZZLE_TEMPLATE = """
+【当前海龟汤题目 - 仅你可见】
+
+汤面（玩家看到的故事）：
+{question}
+
+汤底（标准正确答案）：
+{answer}
+
+请严格根据上面的汤底，判断玩家本次提交的答案是否已抓住核心真相。
+""".strip()
+
 
 class AnswerJudgeOutput(BaseModel):
     """答案裁判的结构化输出"""
@@ -31,51 +41,37 @@ class AnswerJudgeOutput(BaseModel):
     )
 
 
-def create_answer_agent():
-    model = OpenAIChatModel(
-        config.ANS_MODEL,
-        provider=OpenAIProvider(
-            api_key=config.CHERRYIN_KEY, base_url="https://open.cherryin.ai/v1/"
-        ),
+class RatedAnswerJudgeOutput(AnswerJudgeOutput):
+    """带置信度的答案裁判输出，供级联中的廉价模型使用"""
+    confidence: float = Field(
+        ge=0, le=1,
+        description="你对该判定结果的把握程度，0 到 1 之间；拿不准时请给低分"
     )
 
+
+def create_answer_agent(model_name: str = None, output_type=AnswerJudgeOutput):
+    from pydantic_ai import Agent
+    from soup.agents.clients import get_model
+
+    model_name = model_name or config.ANS_MODEL
+    model = get_model(model_name)
+
     answer_agent = Agent[
         SoupState,
-        AnswerJudgeOutput
+        output_type
     ](
         model=model,
-        system_prompt=ANSWER_JUDGE_SYSTEM_PROMPT,
-        output_type=AnswerJudgeOutput,
+        output_type=output_type,
         retries=3,           
     )
 
     @answer_agent.instructions
     def build_answer_judge_instructions(ctx: SoupState) -> str:
         """
-        动态注入当前海龟汤的汤面和汤底（仅裁判可见）
+        规则在前、当前题目（汤面和汤底，仅裁判可见）在后，作为同一段指令发送
         """
-        soup = ctx.deps.current_soup
-        if not soup:
-            raise ValueError("当前没有加载海龟汤题目（current_soup 为空）")
-
-        question = soup.get("question", "").strip()
-        answer = soup.get("answer", "").strip()
-
-        if not question or not answer:
-            raise ValueError("current_soup 缺少 question 或 answer 字段")
-
-        return f"""
-    【当前海龟汤题目 - 仅你可见】
-
-    汤面（玩家看到的故事）：
-    {question}
-
-    汤底（标准正确答案）：
-    {answer}
-
-    请严格根据上面的汤底，判断玩家本次提交的答案是否已抓住核心真相。
-    """.strip()
+        return puzzle_instructions(ANSWER_JUDGE_SYSTEM_PROMPT, ANSWER_PUZZLE_TEMPLATE, ctx.deps.current_soup)
 
-    logger.info(f"Answer Judge Agent created successfully. (model={config.ANS_MODEL})")
+    logger.info(f"Answer Judge Agent created successfully. (model={model_name})")
     
     return answer_agent
\ No newline at end of file
@@ -0,0 +1,166 @@
+import asyncio
+from typing import Dict, List, Literal, Tuple
+
+from pydantic import BaseModel, Field
+from pydantic_ai import Agent
+
+from soup.agents.clients import get_model
+from soup.agents.dep import SoupState
+from soup.agents.judge_agent import JUDGE_SYSTEM_PROMPT, JudgeOutput
+from soup import metrics
+from soup.cache import puzzle_key
+from soup.config import config, logger
+
+BATCH_JUDGE_PROMPT = JUDGE_SYSTEM_PROMPT + """
+
+本次会同时给出多道海龟汤题目和多个带编号的玩家提问。
+请对每个编号的提问，只依据它所属题目的汤底独立判断，互不影响。
+每个编号都必须返回且只返回一次结果。
+""".rstrip()
+
+
+class BatchJudgeItem(BaseModel):
+    """单个提问的判定结果"""
+    index: int = Field(description="提问的编号")
+    result: Literal["是", "否", "不相关"] = Field(
+        description="对该提问的最终判定结果"
+    )
+    reasoning: str = Field(
+        description="【内部记录】判断此结果的简要逻辑依据"
+    )
+
+
+class BatchJudgeOutput(BaseModel):
+    """批量判定的结构化输出"""
+    items: List[BatchJudgeItem] = Field(description="每个编号提问的判定结果")
+
+
+def create_batch_judge_agent():
+    model = get_model(config.JUDGE_MODEL)
+
+    batch_agent = Agent[
+        None,
+        BatchJudgeOutput
+    ](
+        model=model,
+        system_prompt=BATCH_JUDGE_PROMPT,
+        output_type=BatchJudgeOutput,
+        retries=1,
+    )
+
+    logger.info(f"Batch Judge Agent created successfully. (model={config.JUDGE_MODEL})")
+
+    return batch_agent
+
+
+def build_batch_prompt(questions: List[Tuple[str, SoupState]]) -> str:
+    """Group numbered questions under their puzzle so each puzzle is sent once"""
+    puzzles: Dict[str, List[int]] = {}
+    soups = {}
+    for i, (_, deps) in enumerate(questions):
+        key = puzzle_key(deps.current_soup)
+        soups[key] = deps.current_soup
+        puzzles.setdefault(key, []).append(i)
+
+    blocks = []
+    for n, (key, indices) in enumerate(puzzles.items(), start=1):
+        soup = soups[key]
+        lines = [
+            f"【题目 {n}】",
+            f"汤面：{soup.get('question', '').strip()}",
+            f"汤底：{soup.get('answer', '').strip()}",
+        ]
+        lines += [f"提问 {i}：{questions[i][0]}" for i in indices]
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+class JudgeBatcher:
+    """Collects questions for a short window and judges them in one model request
+
+    Runs on the shared async runner loop. A malformed batch response falls
+    back to one judge_agent call per question.
+    """
+
+    def __init__(self, judge_agent, window: float = None, max_batch: int = None):
+        self.judge_agent = judge_agent
+        self.batch_agent = create_batch_judge_agent()
+        self.window = config.JUDGE_BATCH_WINDOW_MS / 1000 if window is None else window
+        self.max_batch = config.JUDGE_BATCH_MAX if max_batch is None else max_batch
+        self._pending: List[Tuple[str, SoupState, asyncio.Future]] = []
+        self._timer = None
+        # The loop only holds tasks weakly: keep running batches alive until done
+        self._running = set()
+
+    async def judge(self, content: str, deps: SoupState) -> JudgeOutput:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((content, deps, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, SoupState, asyncio.Future]]) -> None:
+        if len(batch) > 1:
+            outputs = await self._judge_batched(batch)
+            if outputs is not None:
+                for (_, _, future), output in zip(batch, outputs):
+                    if not future.done():
+                        future.set_result(output)
+                return
+
+        # Single question, or the batched response was unusable
+        results = await asyncio.gather(
+            *(self._judge_one(content, deps) for content, deps, _ in batch),
+            return_exceptions=True,
+        )
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _judge_one(self, content: str, deps: SoupState) -> JudgeOutput:
+        metrics.start_run("ask")
+        result = await self.judge_agent.run(content, deps=deps)
+        metrics.record_run_usage("ask", deps.current_soup, result.usage())
+        return result.output
+
+    async def _judge_batched(self, batch) -> List[JudgeOutput]:
+        """One request for the whole batch; None if the response doesn't cover every question"""
+        questions = [(content, deps) for content, deps, _ in batch]
+        try:
+            metrics.start_run("ask")
+            result = await self.batch_agent.run(build_batch_prompt(questions))
+        except Exception as e:
+            logger.warning(f"Batch of {len(batch)} questions failed, judging one by one: {e}")
+            return None
+
+        items = {item.index: item for item in result.output.items}
+        if sorted(items) != list(range(len(batch))):
+            logger.warning(f"Malformed batch response for {len(batch)} questions, judging one by one")
+            return None
+
+        usage = result.usage()
+        for _, deps in questions:
+            metrics.record_run_usage("ask", deps.current_soup, usage, share=1 / len(batch))
+        logger.info(f"Judged {len(batch)} questions in one request")
+        return [
+            JudgeOutput(result=items[i].result, reasoning=items[i].reasoning)
+            for i in range(len(batch))
+        ]
@@ -0,0 +1,111 @@
+"""Cheap-first model cascade
+
+A cheap, fast model answers first and rates its own confidence. The strong
+agent is only asked when that confidence is low, when the verdict is one that
+must not be wrong (「正确」 ends the game), or for a small random audit sample
+that measures how often the two stages disagree.
+"""
+import random
+from typing import Optional, Tuple
+
+from soup import metrics
+from soup.agents.answer_agent import AnswerJudgeOutput, RatedAnswerJudgeOutput, create_answer_agent
+from soup.agents.dep import SoupState
+from soup.agents.judge_agent import JudgeOutput, RatedJudgeOutput, create_judge_agent
+from soup.config import config, logger
+
+
+class ModelCascade:
+    """Runs the cheap agent and escalates to the strong agent when it can't be trusted"""
+
+    def __init__(
+        self,
+        kind: str,
+        cheap_agent,
+        strong_agent,
+        output_type,
+        min_confidence: float,
+        audit_rate: float,
+        always_escalate: Tuple[str, ...] = (),
+        strong_batcher=None,
+    ):
+        self.kind = kind
+        self.cheap_agent = cheap_agent
+        self.strong_agent = strong_agent
+        self.output_type = output_type
+        self.min_confidence = min_confidence
+        self.audit_rate = audit_rate
+        self.always_escalate = always_escalate
+        # Escalations go through the batcher when judge batching is on
+        self.strong_batcher = strong_batcher
+
+    async def run(self, content: str, deps: SoupState):
+        metrics.start_run(self.kind)
+        cheap = await self.cheap_agent.run(content, deps=deps)
+        metrics.record_run_usage(self.kind, deps.current_soup, cheap.usage())
+        draft = cheap.output
+
+        if draft.result in self.always_escalate:
+            reason = "decisive"
+        elif draft.confidence < self.min_confidence:
+            reason = "low_confidence"
+        elif random.random() < self.audit_rate:
+            reason = "audit"
+        else:
+            metrics.CASCADE.inc(1, self.kind, "cheap")
+            return self.output_type(result=draft.result, reasoning=draft.reasoning)
+
+        metrics.CASCADE.inc(1, self.kind, reason)
+        strong = await self._run_strong(content, deps)
+        if strong.result != draft.result:
+            metrics.CASCADE_DISAGREEMENTS.inc(1, self.kind, reason)
+            logger.info(
+                f"Cascade {self.kind} escalated ({reason}): {content[:50]} "
+                f"{draft.result} ({draft.confidence:.2f}) -> {strong.result}"
+            )
+        return strong
+
+    async def _run_strong(self, content: str, deps: SoupState):
+        if self.strong_batcher is not None:
+            # The batcher records its own usage
+            return await self.strong_batcher.judge(content, deps)
+        metrics.start_run(self.kind)
+        strong = await self.strong_agent.run(content, deps=deps)
+        metrics.record_run_usage(self.kind, deps.current_soup, strong.usage())
+        return strong.output
+
+
+def create_judge_cascade(judge_agent, judge_batcher=None) -> Optional[ModelCascade]:
+    """Cascade in front of `judge_agent`, or None if JUDGE_CHEAP_MODEL is not set
+
+    With a `judge_batcher`, escalated questions are batched for the strong model.
+    """
+    if not config.JUDGE_CHEAP_MODEL:
+        return None
+    return ModelCascade(
+        "ask",
+        create_judge_agent(config.JUDGE_CHEAP_MODEL, RatedJudgeOutput),
+        judge_agent,
+        JudgeOutput,
+        config.JUDGE_CASCADE_MIN_CONFIDENCE,
+        config.JUDGE_CASCADE_AUDIT_RATE,
+        strong_batcher=judge_batcher,
+    )
+
+
+def create_answer_cascade(answer_agent) -> Optional[ModelCascade]:
+    """Cascade in front of `answer_agent`, or None if ANS_CHEAP_MODEL is not set
+
+    A cheap 「正确」 always goes to the strong model: it ends the game.
+    """
+    if not config.ANS_CHEAP_MODEL:
+        return None
+    return ModelCascade(
+        "ans",
+        create_answer_agent(config.ANS_CHEAP_MODEL, RatedAnswerJudgeOutput),
+        answer_agent,
+        AnswerJudgeOutput,
+        config.ANS_CASCADE_MIN_CONFIDENCE,
+        config.ANS_CASCADE_AUDIT_RATE,
+        always_escalate=("正确",),
+    )
@@ -0,0 +1,126 @@
+"""Process-wide registry of model clients
+
+Every agent in every game shares one keep-alive HTTP connection pool.
+Providers and models are cached by their settings, so rebuilding agents on
+reload reuses warm connections instead of opening new ones. All model calls
+run on the shared async runner loop, which owns the pool.
+"""
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
+
+import httpx
+from pydantic_ai.models import Model
+from pydantic_ai.models.wrapper import WrapperModel
+from pydantic_ai.models.openai import OpenAIChatModel
+from pydantic_ai.providers.openai import OpenAIProvider
+
+from soup import metrics
+from soup.agents.resilience import ResilientModel
+from soup.config import config, logger
+
+_lock = threading.Lock()
+_http_client: httpx.AsyncClient = None
+_providers: Dict[Tuple[str, str], OpenAIProvider] = {}
+_models: Dict[Tuple[str, str, str, str], Model] = {}
+# Replaces every model when set (benchmarks, offline runs)
+_override_model: Model = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared HTTP client, created on first use with the configured pool limits"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=config.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(config.HTTP_TIMEOUT, connect=config.HTTP_CONNECT_TIMEOUT),
+            )
+            logger.info(
+                f"HTTP pool created (max_connections={config.HTTP_MAX_CONNECTIONS}, "
+                f"keepalive={config.HTTP_MAX_KEEPALIVE})"
+            )
+        return _http_client
+
+
+def get_provider(api_key: str = None, base_url: str = None) -> OpenAIProvider:
+    api_key = api_key or config.CHERRYIN_KEY
+    base_url = base_url or config.MODEL_BASE_URL
+    http_client = get_http_client()
+    with _lock:
+        key = (api_key, base_url)
+        if key not in _providers:
+            _providers[key] = OpenAIProvider(
+                api_key=api_key, base_url=base_url, http_client=http_client
+            )
+        return _providers[key]
+
+
+class MeteredModel(WrapperModel):
+    """Records round-trip time, prompt assembly time and token usage of every request"""
+
+    async def request(self, *args, **kwargs):
+        metrics.observe_prompt_build()
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self.wrapped.request(*args, **kwargs)
+            outcome = "ok"
+        finally:
+            metrics.MODEL_REQUEST_SECONDS.observe(time.perf_counter() - started, self.model_name, outcome)
+        metrics.record_model_usage(self.model_name, response.usage)
+        return response
+
+    @asynccontextmanager
+    async def request_stream(self, *args, **kwargs):
+        metrics.observe_prompt_build()
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            async with self.wrapped.request_stream(*args, **kwargs) as stream:
+                yield stream
+            outcome = "ok"
+        finally:
+            metrics.MODEL_REQUEST_SECONDS.observe(time.perf_counter() - started, self.model_name, outcome)
+        metrics.record_model_usage(self.model_name, stream.usage())
+
+
+def override_model(model: Model = None) -> None:
+    """Make agents created from now on use `model` instead of the provider; None restores"""
+    global _override_model
+    _override_model = MeteredModel(ResilientModel(model)) if model is not None else None
+
+
+def get_model(model_name: str) -> Model:
+    """A chat model on the shared provider, reused across agents and reloads"""
+    if _override_model is not None:
+        return _override_model
+    provider = get_provider()
+    with _lock:
+        key = (model_name, config.CHERRYIN_KEY, provider.base_url, config.HEDGE_MODEL)
+        if key not in _models:
+            fallback = None
+            if config.HEDGE_MODEL and config.HEDGE_MODEL != model_name:
+                fallback = OpenAIChatModel(config.HEDGE_MODEL, provider=provider)
+            _models[key] = MeteredModel(
+                ResilientModel(OpenAIChatModel(model_name, provider=provider), fallback)
+            )
+        return _models[key]
+
+
+async def warm_up() -> None:
+    """Open a pooled connection to the provider ahead of the first question"""
+    provider = get_provider()
+    try:
+        response = await get_http_client().get(
+            f"{str(provider.base_url).rstrip('/')}/models",
+            headers={"Authorization": f"Bearer {config.CHERRYIN_KEY}"},
+        )
+        logger.info(f"Model client warmed up ({response.status_code})")
+    except httpx.HTTPError as e:
+        logger.warning(f"Model client warm-up failed: {e}")
@@ -0,0 +1,75 @@
+"""Deterministic stand-in for the provider, for benchmarks and offline runs
+
+Built on pydantic-ai's FunctionModel: it answers whatever output tool the
+agent asks for, after a configurable latency, with verdicts derived from a
+hash of the prompt so repeated runs see the same answers.
+"""
+import asyncio
+import json
+import random
+import re
+import zlib
+from typing import AsyncIterator, Dict, List
+
+from pydantic_ai.messages import ModelMessage, ModelResponse, ToolCallPart, UserPromptPart
+from pydantic_ai.models.function import AgentInfo, DeltaToolCall, DeltaToolCalls, FunctionModel
+
+
+def _last_prompt(messages: List[ModelMessage]) -> str:
+    for message in reversed(messages):
+        for part in reversed(getattr(message, "parts", [])):
+            if isinstance(part, UserPromptPart):
+                return str(part.content)
+    return ""
+
+
+def fake_output(schema: Dict, prompt: str, correct_rate: float = 0.1) -> Dict:
+    """Arguments for one of the agents' output tools, derived from a hash of the prompt"""
+    digest = zlib.crc32(prompt.encode("utf-8"))
+    properties = schema.get("properties", {})
+
+    if "questions" in properties:
+        return {"questions": [f"{prompt[:8]}的问题{i}吗" for i in range(10)]}
+
+    if "items" in properties:
+        indices = [int(i) for i in re.findall(r"提问 (\d+)：", prompt)]
+        return {"items": [
+            {"index": i, "result": ("是", "否", "不相关")[(digest + i) % 3], "reasoning": "fake"}
+            for i in indices
+        ]}
+
+    choices = properties.get("result", {}).get("enum", ["是"])
+    if "正确" in choices:
+        result = "正确" if (digest % 1000) / 1000 < correct_rate else "错误"
+    else:
+        result = choices[digest % len(choices)]
+    output = {"result": result, "reasoning": "fake"}
+    if "confidence" in properties:
+        output["confidence"] = (digest >> 8) % 100 / 100
+    return output
+
+
+def create_fake_model(latency: float = 0.0, jitter: float = 0.0, correct_rate: float = 0.1, seed: int = 0) -> FunctionModel:
+    """A FunctionModel that sleeps `latency` (+ up to `jitter`) seconds per request"""
+    rng = random.Random(seed)
+
+    async def respond(messages: List[ModelMessage], info: AgentInfo) -> ModelResponse:
+        if latency or jitter:
+            await asyncio.sleep(latency + rng.random() * jitter)
+
+        tool = info.output_tools[0]
+        args = fake_output(tool.parameters_json_schema, _last_prompt(messages), correct_rate)
+        return ModelResponse(parts=[ToolCallPart(tool.name, args)], model_name="fake")
+
+    async def respond_stream(messages: List[ModelMessage], info: AgentInfo) -> AsyncIterator[DeltaToolCalls]:
+        if latency or jitter:
+            await asyncio.sleep(latency + rng.random() * jitter)
+
+        tool = info.output_tools[0]
+        args = fake_output(tool.parameters_json_schema, _last_prompt(messages), correct_rate)
+        text = json.dumps(args, ensure_ascii=False)
+        yield {0: DeltaToolCall(name=tool.name)}
+        for i in range(0, len(text), 8):
+            yield {0: DeltaToolCall(json_args=text[i:i + 8])}
+
+    return FunctionModel(respond, stream_function=respond_stream, model_name="fake")
@@ -0,0 +1,60 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+from pydantic_ai import Agent
+
+from soup.agents.clients import get_model
+from soup.agents.dep import SoupState
+from soup.config import config, logger
+
+FAQ_SYSTEM_PROMPT = """
+你现在是「海龟汤」游戏的出题助手。
+你的任务是：根据汤面和汤底，预测玩家在推理过程中最可能提出的「是否」疑问句。
+
+要求：
+1. 每个问题都必须能用「是」「否」或「不相关」回答。
+2. 问题要贴近真实玩家的口吻，简短直接，例如「他是自杀吗」「是小偷干的吗」。
+3. 既要包含接近真相的问题，也要包含常见的错误方向和无关问题。
+4. 不要重复，不要在问题中直接给出汤底。
+""".strip()
+
+
+class FaqQuestions(BaseModel):
+    """出题助手的结构化输出"""
+    questions: List[str] = Field(
+        description="玩家可能提出的是否疑问句列表"
+    )
+
+
+def create_faq_agent():
+    model = get_model(config.JUDGE_MODEL)
+
+    faq_agent = Agent[
+        SoupState,
+        FaqQuestions
+    ](
+        model=model,
+        system_prompt=FAQ_SYSTEM_PROMPT,
+        output_type=FaqQuestions,
+        retries=2,
+    )
+
+    @faq_agent.instructions
+    def build_faq_instructions(ctx: SoupState) -> str:
+        """
+        注入当前海龟汤的汤面和汤底
+        """
+        soup = ctx.deps.current_soup
+        if not soup:
+            raise ValueError("当前没有加载海龟汤题目（current_soup 为空）")
+
+        return f"""
+    汤面（玩家看到的故事）：
+    {soup.get("question", "").strip()}
+    汤底（隐藏的真相）：
+    {soup.get("answer", "").strip()}
+        """.strip()
+
+    logger.info(f"FAQ Agent created successfully. (model={config.JUDGE_MODEL})")
+
+    return faq_agent
@@ -1,11 +1,9 @@
 from typing import Literal
 
 from pydantic import BaseModel, Field
-from pydantic_ai import Agent
-from pydantic_ai.models.openai import OpenAIChatModel
-from pydantic_ai.providers.openai import OpenAIProvider
 
 from soup.agents.dep import SoupState
+from soup.agents.prompts import puzzle_instructions
 from soup.config import config, logger
 
 JUDGE_SYSTEM_PROMPT = """
@@ -22,6 +20,14 @@ JUDGE_SYSTEM_PROMPT = """
 4. 当你判断用户的输入没有意义、无法理解或与汤底无关时，直接回答「不相关」。
 """.strip()
 
+JUDGE_PUZZLE_TEMPLATE = """
+当前海龟汤题目（仅你可见）：
+汤面（玩家看到的故事）：
+{question}
+汤底（隐藏的真相）：
+{answer}
+""".strip()
+
 
 class JudgeOutput(BaseModel):
     """Judge 代理的结构化输出"""
@@ -32,22 +38,28 @@ class JudgeOutput(BaseModel):
         description="【内部记录】判断此结果的简要逻辑依据，仅用于调试和日志，不会在回复中显示"
     )
 
-def create_judge_agent():
-    model = OpenAIChatModel(
-        config.JUDGE_MODEL,   
-        provider=OpenAIProvider(
-            api_key=config.CHERRYIN_KEY,
-            base_url="https://open.cherryin.ai/v1/",
-        )
+class RatedJudgeOutput(JudgeOutput):
+    """带置信度的 Judge 输出，供级联中的廉价模型使用"""
+    confidence: float = Field(
+        ge=0, le=1,
+        description="你对该判定结果的把握程度，0 到 1 之间；拿不准时请给低分"
     )
 
+
+def create_judge_agent(model_name: str = None, output_type=JudgeOutput):
+    # Output types stay importable without pydantic-ai, only building an agent needs it
+    from pydantic_ai import Agent
+    from soup.agents.clients import get_model
+
+    model_name = model_name or config.JUDGE_MODEL
+    model = get_model(model_name)
+
     judge_agent = Agent[
         SoupState,           
-        JudgeOutput          
+        output_type          
     ](
         model=model,
-        system_prompt=JUDGE_SYSTEM_PROMPT,
-        output_type=JudgeOutput,
+        output_type=output_type,
         retries=2,           
     )
 
@@ -56,25 +68,10 @@ def create_judge_agent():
     @judge_agent.instructions
     def build_judge_instructions(ctx: SoupState) -> str:
         """
-        动态注入当前海龟汤的汤面和汤底（仅 Judge 能看到）。
+        规则在前、当前题目（汤面和汤底，仅 Judge 能看到）在后，作为同一段指令发送。
         """
-        soup = ctx.deps.current_soup
-        if not soup:
-            raise ValueError("当前没有加载海龟汤题目（current_soup 为空）")
-
-        question = soup.get("question", "").strip()
-        answer = soup.get("answer", "").strip()
-
-        if not question or not answer:
-            raise ValueError("current_soup 缺少 question 或 answer 字段")
-
-        return f"""
-    当前海龟汤题目（仅你可见）：
-    汤面（玩家看到的故事）：
-    {question}
-    汤底（隐藏的真相）：
-    {answer}
-        """.strip()
-    logger.info(f"Ask Judge Agent created successfully. (model={config.JUDGE_MODEL})")
+        return puzzle_instructions(JUDGE_SYSTEM_PROMPT, JUDGE_PUZZLE_TEMPLATE, ctx.deps.current_soup)
+
+    logger.info(f"Ask Judge Agent created successfully. (model={model_name})")
 
     return judge_agent
\ No newline at end of file
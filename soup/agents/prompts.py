@@ -0,0 +1,37 @@
+"""Prompt assembly that keeps provider prefix caches warm
+
+OpenAI-compatible providers reuse a cached prompt prefix only when the
+leading bytes are identical. pydantic-ai sends `instructions` before the
+`system_prompt`, so the agents pass everything as one instructions string:
+the static rules first, then the puzzle block. It is built once per puzzle
+and the same string object is returned afterwards, which leaves the
+player's input as the only part that changes between calls.
+"""
+from functools import lru_cache
+from typing import Dict
+
+# Assembled prompts kept, per (rules, template, puzzle)
+PROMPT_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _assemble(rules: str, puzzle_template: str, question: str, answer: str) -> str:
+    return f"{rules}\n\n{puzzle_template.format(question=question, answer=answer)}"
+
+
+def puzzle_instructions(rules: str, puzzle_template: str, soup: Dict) -> str:
+    """Static rules followed by the puzzle block, byte for byte the same for a given puzzle"""
+    if not soup:
+        raise ValueError("当前没有加载海龟汤题目（current_soup 为空）")
+
+    question = soup.get("question", "").strip()
+    answer = soup.get("answer", "").strip()
+    if not question or not answer:
+        raise ValueError("current_soup 缺少 question 或 answer 字段")
+
+    return _assemble(rules, puzzle_template, question, answer)
+
+
+def prompt_cache_stats() -> Dict[str, int]:
+    info = _assemble.cache_info()
+    return {"size": info.currsize, "hits": info.hits, "misses": info.misses}
@@ -0,0 +1,176 @@
+"""Deadlines, hedged requests and circuit breaking for model calls
+
+ResilientModel wraps a provider model. Every request gets a deadline
+(MODEL_DEADLINE). Once it has run longer than the HEDGE_PERCENTILE of recent
+latencies, a duplicate goes out, to HEDGE_MODEL if set, and the first answer
+wins. A circuit breaker per model fails fast while the provider's recent
+error rate is above BREAKER_ERROR_RATE, then lets a single probe through
+after BREAKER_COOLDOWN.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from pydantic_ai.models import Model
+from pydantic_ai.models.wrapper import WrapperModel
+
+from soup import metrics
+from soup.config import config, logger
+
+# Recent latencies kept per model for the hedging percentile
+LATENCY_SAMPLES = 200
+# Samples needed before hedging starts
+MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitOpenError(RuntimeError):
+    """The model's circuit is open: the provider is failing, the call was not made"""
+
+
+class ModelDeadlineError(TimeoutError):
+    """A model request ran past MODEL_DEADLINE"""
+
+
+class CircuitBreaker:
+    """Closed -> open on a high error rate over a sliding window -> half-open probe after a cooldown"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._outcomes = deque()  # (time, ok)
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self._opened_at < config.BREAKER_COOLDOWN:
+            return False
+        # Half-open: let one request through to test the provider
+        self._probing = True
+        return True
+
+    def release(self) -> None:
+        """A request was cancelled before its outcome was known"""
+        self._probing = False
+
+    def record(self, ok: bool) -> None:
+        now = time.monotonic()
+        if self._opened_at is not None:
+            if self._probing:
+                self._probing = False
+                if ok:
+                    logger.info(f"Circuit for {self.name} closed")
+                    self._opened_at = None
+                    self._outcomes.clear()
+                    self._failures = 0
+                else:
+                    self._opened_at = now
+            return
+
+        self._outcomes.append((now, ok))
+        self._failures += not ok
+        while self._outcomes and now - self._outcomes[0][0] > config.BREAKER_WINDOW:
+            self._failures -= not self._outcomes.popleft()[1]
+
+        total = len(self._outcomes)
+        if (
+            config.BREAKER_ERROR_RATE > 0
+            and total >= config.BREAKER_MIN_REQUESTS
+            and self._failures / total >= config.BREAKER_ERROR_RATE
+        ):
+            logger.warning(f"Circuit for {self.name} opened: {self._failures}/{total} recent requests failed")
+            metrics.CIRCUIT_OPENED.inc(1, self.name)
+            self._opened_at = now
+
+
+class ResilientModel(WrapperModel):
+    """Applies the deadline, hedging and circuit breaker around the wrapped model"""
+
+    def __init__(self, wrapped: Model, fallback: Model = None):
+        super().__init__(wrapped)
+        self.fallback = fallback
+        self.breaker = CircuitBreaker(self.wrapped.model_name)
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def hedge_delay(self):
+        """Seconds after which a duplicate request is sent, None if hedging is off"""
+        if config.HEDGE_PERCENTILE <= 0 or len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * config.HEDGE_PERCENTILE / 100))
+        return max(config.HEDGE_MIN_DELAY, ordered[index])
+
+    async def request(self, *args, **kwargs):
+        self._check_circuit()
+        try:
+            async with asyncio.timeout(config.MODEL_DEADLINE or None):
+                response = await self._hedged(args, kwargs)
+        except BaseException as e:
+            raise self._failed(e)
+        self.breaker.record(True)
+        return response
+
+    @asynccontextmanager
+    async def request_stream(self, *args, **kwargs):
+        # Streams are not hedged: the first tokens are already on their way
+        self._check_circuit()
+        try:
+            async with asyncio.timeout(config.MODEL_DEADLINE or None):
+                async with self.wrapped.request_stream(*args, **kwargs) as stream:
+                    yield stream
+        except BaseException as e:
+            raise self._failed(e)
+        self.breaker.record(True)
+
+    def _check_circuit(self) -> None:
+        if not self.breaker.allow():
+            name = self.wrapped.model_name
+            metrics.CIRCUIT_REJECTED.inc(1, name)
+            raise CircuitOpenError(f"Model {name} is unavailable (circuit open)")
+
+    def _failed(self, error: BaseException) -> BaseException:
+        """Record a failed request and return the exception to raise"""
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            self.breaker.release()
+            return error
+        self.breaker.record(False)
+        if isinstance(error, TimeoutError):
+            name = self.wrapped.model_name
+            metrics.DEADLINE_EXCEEDED.inc(1, name)
+            deadline_error = ModelDeadlineError(f"Model {name} did not answer within {config.MODEL_DEADLINE}s")
+            deadline_error.__cause__ = error
+            return deadline_error
+        return error
+
+    async def _hedged(self, args, kwargs):
+        delay = self.hedge_delay()
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(self.wrapped.request(*args, **kwargs))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if not done:
+                metrics.HEDGES.inc(1, self.wrapped.model_name, "sent")
+                hedge = asyncio.ensure_future((self.fallback or self.wrapped).request(*args, **kwargs))
+                pending = {primary, hedge}
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            winner = "primary" if task is primary else "hedge"
+                            metrics.HEDGES.inc(1, self.wrapped.model_name, winner)
+                            return task.result()
+            return primary.result()
+        finally:
+            # A primary still running took at least this long: keep the tail in the samples
+            if not primary.done() or primary.cancelled() or primary.exception() is None:
+                self.latencies.append(time.perf_counter() - started)
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
@@ -0,0 +1,172 @@
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from soup.config import config, logger
+
+# Characters that flip the meaning of a question; fuzzy matches must agree on them
+NEGATIONS = frozenset("不没無无非别未否")
+
+
+def normalize_question(text: str) -> str:
+    """Normalize a question for cache lookup
+
+    NFKC folds full-width characters to half-width, then case, whitespace,
+    punctuation and symbols are dropped: "他是自杀吗？" == "他是自杀吗 ?".
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(
+        ch for ch in text
+        if unicodedata.category(ch)[0] not in "PZSC"
+    )
+
+
+def puzzle_key(soup: Dict) -> str:
+    """Stable identity of a puzzle, derived from its content"""
+    digest = hashlib.sha1()
+    digest.update(soup.get("question", "").encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(soup.get("answer", "").encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def char_ngrams(text: str, n: int = 2) -> frozenset:
+    if len(text) < n:
+        return frozenset((text,))
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def ngram_similarity(a: frozenset, b: frozenset) -> float:
+    """Dice coefficient of two n-gram sets"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class _Entry:
+    __slots__ = ("output", "created", "ngrams", "negations")
+
+    def __init__(self, output, question: str):
+        self.output = output
+        self.created = time.monotonic()
+        self.ngrams = char_ngrams(question)
+        self.negations = NEGATIONS.intersection(question)
+
+
+class VerdictCache:
+    """LRU/TTL cache of judge verdicts keyed by puzzle identity and normalized question"""
+
+    def __init__(self, max_entries: int = None, ttl: float = None, fuzzy_threshold: float = None):
+        self.max_entries = config.VERDICT_CACHE_SIZE if max_entries is None else max_entries
+        self.ttl = config.VERDICT_CACHE_TTL if ttl is None else ttl
+        self.fuzzy_threshold = config.VERDICT_CACHE_FUZZY if fuzzy_threshold is None else fuzzy_threshold
+
+        # Global LRU order over (puzzle, question) plus a per-puzzle table for fuzzy scans
+        self._lru: OrderedDict = OrderedDict()
+        self._puzzles: Dict[str, Dict[str, _Entry]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def get(self, soup: Dict, question: str):
+        """Return a cached verdict for the question, or None"""
+        if not self.enabled or not soup:
+            return None
+
+        key = puzzle_key(soup)
+        normalized = normalize_question(question)
+        with self._lock:
+            table = self._puzzles.get(key)
+            entry = table.get(normalized) if table else None
+            if entry is not None and self._expired(entry):
+                self._remove(key, normalized)
+                entry = None
+
+            if entry is not None:
+                self._lru.move_to_end((key, normalized))
+                self.hits += 1
+                return entry.output
+
+            if table and self.fuzzy_threshold > 0:
+                match = self._fuzzy_lookup(table, normalized)
+                if match is not None:
+                    self._lru.move_to_end((key, match))
+                    self.fuzzy_hits += 1
+                    return table[match].output
+
+            self.misses += 1
+            return None
+
+    def put(self, soup: Dict, question: str, output) -> None:
+        if not self.enabled or not soup:
+            return
+
+        key = puzzle_key(soup)
+        normalized = normalize_question(question)
+        with self._lock:
+            self._puzzles.setdefault(key, {})[normalized] = _Entry(output, normalized)
+            self._lru[(key, normalized)] = None
+            self._lru.move_to_end((key, normalized))
+
+            while len(self._lru) > self.max_entries:
+                old_key, old_question = next(iter(self._lru))
+                self._remove(old_key, old_question)
+                self.evictions += 1
+
+    def clear(self, soup: Dict = None) -> None:
+        """Drop cached verdicts for one puzzle, or for every puzzle"""
+        with self._lock:
+            keys = [puzzle_key(soup)] if soup else list(self._puzzles)
+            for key in keys:
+                for question in list(self._puzzles.get(key, ())):
+                    self._remove(key, question)
+        logger.info(f"Verdict cache cleared for {len(keys)} puzzle(s)")
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.fuzzy_hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "puzzles": len(self._puzzles),
+            "hits": self.hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.fuzzy_hits) / lookups if lookups else 0.0,
+        }
+
+    def _expired(self, entry: _Entry) -> bool:
+        return self.ttl > 0 and time.monotonic() - entry.created > self.ttl
+
+    def _fuzzy_lookup(self, table: Dict[str, _Entry], normalized: str) -> Optional[str]:
+        ngrams = char_ngrams(normalized)
+        negations = NEGATIONS.intersection(normalized)
+        best, best_score = None, self.fuzzy_threshold
+        for question, entry in table.items():
+            # "他是自杀吗" and "他不是自杀吗" look alike but have opposite answers
+            if entry.negations != negations or self._expired(entry):
+                continue
+            score = ngram_similarity(ngrams, entry.ngrams)
+            if score >= best_score:
+                best, best_score = question, score
+        return best
+
+    def _remove(self, key: str, question: str) -> None:
+        self._lru.pop((key, question), None)
+        table = self._puzzles.get(key)
+        if table is not None:
+            table.pop(question, None)
+            if not table:
+                del self._puzzles[key]
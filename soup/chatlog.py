@@ -0,0 +1,86 @@
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterator, List, Tuple
+
+
+class ChatRecord:
+    """A single chat message with its sequence number in the game"""
+
+    __slots__ = ("seq", "sayer", "content")
+
+    def __init__(self, seq: int, sayer: str, content: str):
+        self.seq = seq
+        self.sayer = sayer
+        self.content = content
+
+    def to_dict(self) -> Dict:
+        return {'sayer': self.sayer, 'content': self.content}
+
+
+class ChatLog:
+    """Append-only chat log with stable sequence numbers and a retention window
+
+    Sequence numbers start at 0 for every game and never shift, so a client
+    cursor stays valid when old messages fall out of the window.
+    """
+
+    __slots__ = ("_records", "_next_seq")
+
+    def __init__(self, retention: int = 0):
+        self._records = deque(maxlen=retention or None)
+        self._next_seq = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[ChatRecord]:
+        return iter(self._records)
+
+    @property
+    def first_seq(self) -> int:
+        """Sequence number of the oldest retained message"""
+        return self._next_seq - len(self._records)
+
+    @property
+    def next_seq(self) -> int:
+        """Sequence number the next message will get; the cursor of an up-to-date client"""
+        return self._next_seq
+
+    @classmethod
+    def restore(cls, first_seq: int, messages: List, retention: int = 0) -> "ChatLog":
+        """Rebuild a log from `dump()` output, keeping the original sequence numbers"""
+        log = cls(retention)
+        log._next_seq = first_seq
+        for sayer, content in messages:
+            log.append(sayer, content)
+        return log
+
+    def dump(self) -> Tuple[int, List]:
+        """`first_seq` and the retained messages as [sayer, content] pairs
+
+        Both come from one copy of the records, so they agree even when an
+        append moves the retention window meanwhile.
+        """
+        next_seq = self._next_seq
+        records = list(self._records)
+        first_seq = records[0].seq if records else next_seq
+        return first_seq, [[record.sayer, record.content] for record in records]
+
+    def append(self, sayer: str, content: str) -> ChatRecord:
+        record = ChatRecord(self._next_seq, sayer, content)
+        self._records.append(record)
+        self._next_seq += 1
+        return record
+
+    def since(self, seq: int, until: int = None) -> List[ChatRecord]:
+        """Messages in [seq, until); older ones that left the window are skipped"""
+        end = self._next_seq
+        count = end - max(seq, self.first_seq)
+        if count <= 0:
+            return []
+        # Walk from the newest end so reading costs O(new messages), not O(history)
+        records = list(islice(reversed(self._records), count))
+        records.reverse()
+        if until is not None and until < end:
+            records = records[:max(0, len(records) - (end - until))]
+        return records
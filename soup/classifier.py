@@ -0,0 +1,247 @@
+"""Local pre-classifier that answers obvious junk without calling the model
+
+Two stages, both CPU-only:
+1. Rules for input that is certainly junk (no letters or digits at all,
+   one character repeated).
+2. An optional logistic regression over hashed character n-grams that
+   predicts whether a question is junk whatever the puzzle (greetings,
+   chatter, gibberish). It is trained from logged traffic (TRAFFIC_LOG)
+   whose lines were labeled by hand with "junk": true or false:
+       python -m soup.classifier train traffic.jsonl
+   The model's verdicts are not used as labels: 「不相关」 depends on the
+   puzzle, which the features don't see. The learned stage only answers
+   questions, above a high probability threshold; a solution attempt is
+   never rejected without the model.
+
+Anything it is unsure about goes to the agents as before.
+"""
+import argparse
+import atexit
+import json
+import math
+import os
+import queue
+import random
+import re
+import threading
+import unicodedata
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from soup.config import config, logger
+
+HASH_BITS = 18
+NGRAM_SIZES = (1, 2, 3)
+# What each agent answers for junk input, see the system prompts
+JUNK_VERDICTS = {"ask": "不相关", "ans": "错误"}
+QUESTION_PATTERN = re.compile(r"(吗|嘛|么|呢|是否|是不是|有没有|会不会|能不能|对不对|[?？])$")
+
+# Lines written per batch by the traffic log writer
+TRAFFIC_BATCH = 256
+
+# (path, line) waiting for the writer thread, None stops it
+_traffic_queue: "queue.SimpleQueue[Optional[Tuple[str, str]]]" = queue.SimpleQueue()
+_traffic_writer: Optional[threading.Thread] = None
+_traffic_lock = threading.Lock()
+
+
+def log_traffic(kind: str, content: str, verdict: str) -> None:
+    """Queue a model verdict for the traffic log; a writer thread appends it to the file"""
+    if not config.TRAFFIC_LOG:
+        return
+    line = json.dumps({"kind": kind, "content": content, "verdict": verdict}, ensure_ascii=False)
+    _traffic_queue.put((config.TRAFFIC_LOG, line))
+    if _traffic_writer is None:
+        _start_traffic_writer()
+
+
+def _start_traffic_writer() -> None:
+    global _traffic_writer
+    with _traffic_lock:
+        if _traffic_writer is None:
+            _traffic_writer = threading.Thread(target=_write_traffic, name="soup-traffic-log", daemon=True)
+            _traffic_writer.start()
+            atexit.register(_stop_traffic_writer)
+
+
+def _write_traffic() -> None:
+    """Append queued lines in batches, one open() per batch and file"""
+    stop = False
+    while not stop:
+        batch = [_traffic_queue.get()]
+        while len(batch) < TRAFFIC_BATCH:
+            try:
+                batch.append(_traffic_queue.get_nowait())
+            except queue.Empty:
+                break
+        by_path: Dict[str, List[str]] = {}
+        for item in batch:
+            if item is None:
+                stop = True
+            else:
+                by_path.setdefault(item[0], []).append(item[1] + "\n")
+        for path, lines in by_path.items():
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+            except OSError as e:
+                logger.error(f"Failed to write traffic log {path}: {e}")
+
+
+def _stop_traffic_writer() -> None:
+    """Write what is still queued before the process exits"""
+    _traffic_queue.put(None)
+    _traffic_writer.join(timeout=5)
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).strip().lower()
+
+
+def extract_features(kind: str, content: str) -> List[int]:
+    """Hashed character n-grams plus a few shape features, prefixed by the input kind"""
+    text = _normalize(content)
+    mask = (1 << HASH_BITS) - 1
+    tokens = [f"{kind}:len{min(len(text) // 5, 10)}"]
+    if QUESTION_PATTERN.search(text):
+        tokens.append(f"{kind}:question")
+    for n in NGRAM_SIZES:
+        padded = f"^{text}$" if n > 1 else text
+        tokens.extend(f"{kind}:{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+    return sorted({zlib.crc32(token.encode("utf-8")) & mask for token in tokens})
+
+
+def _sigmoid(z: float) -> float:
+    if z < -30:
+        return 0.0
+    if z > 30:
+        return 1.0
+    return 1 / (1 + math.exp(-z))
+
+
+class LinearModel:
+    """Sparse binary logistic regression over hashed features"""
+
+    def __init__(self, weights: Dict[int, float] = None, bias: float = 0.0):
+        self.weights = weights or {}
+        self.bias = bias
+
+    def predict(self, features: List[int]) -> float:
+        weights = self.weights
+        return _sigmoid(self.bias + sum(weights.get(f, 0.0) for f in features))
+
+    def fit(self, samples: List[Tuple[List[int], int]], epochs: int = 10, lr: float = 0.1, l2: float = 1e-6) -> None:
+        samples = list(samples)
+        for _ in range(epochs):
+            random.shuffle(samples)
+            for features, label in samples:
+                error = self.predict(features) - label
+                self.bias -= lr * error
+                for f in features:
+                    w = self.weights.get(f, 0.0)
+                    self.weights[f] = w - lr * (error + l2 * w)
+
+    def save(self, path: str) -> None:
+        data = {
+            "hash_bits": HASH_BITS,
+            "bias": self.bias,
+            "weights": {str(f): round(w, 5) for f, w in self.weights.items() if abs(w) > 1e-4},
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path: str) -> "LinearModel":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("hash_bits") != HASH_BITS:
+            raise ValueError("Classifier was trained with different features")
+        return cls({int(f): w for f, w in data["weights"].items()}, data["bias"])
+
+
+class PreClassifier:
+    """Answers obvious junk locally; returns None whenever the model should decide"""
+
+    def __init__(self, model_path: str = None, threshold: float = None):
+        self.threshold = config.CLASSIFIER_THRESHOLD if threshold is None else threshold
+        self.model = None
+        model_path = model_path or config.CLASSIFIER_MODEL
+        if model_path and os.path.exists(model_path):
+            try:
+                self.model = LinearModel.load(model_path)
+                logger.info(f"Pre-classifier model loaded ({len(self.model.weights)} weights)")
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Failed to load pre-classifier model {model_path}: {e}")
+        self.local = 0
+        self.passed = 0
+
+    def classify(self, kind: str, content: str) -> Optional[Tuple[str, str]]:
+        """(verdict, reason) for certain junk, None if unsure"""
+        result = self._classify(kind, content)
+        if result is None:
+            self.passed += 1
+        else:
+            self.local += 1
+        return result
+
+    def _classify(self, kind: str, content: str) -> Optional[Tuple[str, str]]:
+        text = _normalize(content)
+        verdict = JUNK_VERDICTS[kind]
+
+        words = [ch for ch in text if unicodedata.category(ch)[0] in "LN"]
+        if not words:
+            return verdict, "输入不含文字"
+        if len(set(words)) <= 1 and len(words) > 1:
+            return verdict, "输入为重复字符"
+
+        # Whether a solution attempt is wrong depends on the puzzle: only the agent decides
+        if self.model is not None and kind == "ask":
+            p = self.model.predict(extract_features(kind, content))
+            if p >= self.threshold:
+                return verdict, f"本地模型判定（p={p:.3f}）"
+        return None
+
+
+def train(traffic_path: str, output_path: str, epochs: int = 10) -> None:
+    """Train the linear model from questions of a traffic log labeled with "junk" """
+    samples = []
+    with open(traffic_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Only labeled questions: the learned stage never answers solution attempts
+            if item.get("kind") != "ask" or not isinstance(item.get("junk"), bool):
+                continue
+            samples.append((extract_features("ask", item.get("content", "")), int(item["junk"])))
+
+    if not samples:
+        logger.error(f'No labeled questions in {traffic_path} (add "junk": true or false to its lines)')
+        return
+
+    model = LinearModel()
+    model.fit(samples, epochs=epochs)
+    correct = sum((model.predict(x) >= 0.5) == bool(y) for x, y in samples)
+    model.save(output_path)
+    logger.info(
+        f"Pre-classifier trained on {len(samples)} samples "
+        f"(train accuracy {correct / len(samples):.3f}) -> {output_path}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local pre-classifier tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_parser = sub.add_parser("train", help="Train from a traffic log")
+    train_parser.add_argument("traffic", help="Traffic log (JSONL) written with TRAFFIC_LOG")
+    train_parser.add_argument("--output", default=config.CLASSIFIER_MODEL, help="Model file")
+    train_parser.add_argument("--epochs", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        train(args.traffic, args.output, epochs=args.epochs)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,149 @@
 import os
 
 import loguru
-from dotenv import load_dotenv
+from dotenv import dotenv_values, find_dotenv
 
 logger = loguru.logger
 
+# Variables of the real environment win over .env, also on reload
+_PROCESS_ENV = frozenset(os.environ)
+# Variables last taken from .env, unset again when removed from the file
+_dotenv_keys = set()
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    """Read a boolean flag from the environment"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def load_env_file() -> str:
+    """Apply .env on top of the process environment. Returns its path, '' if there is none."""
+    path = find_dotenv()
+    values = {
+        key: value for key, value in (dotenv_values(path) if path else {}).items()
+        if value is not None and key not in _PROCESS_ENV
+    }
+    for key in _dotenv_keys - values.keys():
+        os.environ.pop(key, None)
+    os.environ.update(values)
+    _dotenv_keys.clear()
+    _dotenv_keys.update(values)
+    return path
+
+
 class Config:
     def __init__(self):
         self.reload()
 
-    def reload(self):
-        load_dotenv()
+    def reload(self) -> set:
+        """Re-read .env and the environment. Returns the names of the settings that changed.
+
+        Settings are read into a fresh object and swapped in with one dict
+        update, so a request never sees half of the old and half of the new ones.
+        """
+        fresh = Config.__new__(Config)
+        fresh._load()
+        changed = {name for name, value in fresh.__dict__.items() if getattr(self, name, None) != value}
+        self.__dict__.update(fresh.__dict__)
+        return changed
+
+    def _load(self):
+        self.ENV_FILE = load_env_file()
         self.BASE_DIR = os.path.dirname(os.path.abspath(__file__))
         self.CHERRYIN_KEY = os.getenv("CHERRYIN_KEY")
+        # Any OpenAI-compatible endpoint, e.g. the local stub_server.py
+        self.MODEL_BASE_URL = os.getenv("MODEL_BASE_URL", "https://open.cherryin.ai/v1/")
         self.JUDGE_MODEL = os.getenv("JUDGE_MODEL", "agent/deepseek-v3.2(free)")
         self.ANS_MODEL = os.getenv("ANS_MODEL", "agent/deepseek-v3.2(free)")
+        # Cheap-first cascade per agent (empty cheap model disables it): escalate to
+        # the model above below this self-rated confidence, and audit a random sample
+        self.JUDGE_CHEAP_MODEL = os.getenv("JUDGE_CHEAP_MODEL", "")
+        self.JUDGE_CASCADE_MIN_CONFIDENCE = float(os.getenv("JUDGE_CASCADE_MIN_CONFIDENCE", "0.8"))
+        self.JUDGE_CASCADE_AUDIT_RATE = float(os.getenv("JUDGE_CASCADE_AUDIT_RATE", "0.02"))
+        self.ANS_CHEAP_MODEL = os.getenv("ANS_CHEAP_MODEL", "")
+        self.ANS_CASCADE_MIN_CONFIDENCE = float(os.getenv("ANS_CASCADE_MIN_CONFIDENCE", "0.8"))
+        self.ANS_CASCADE_AUDIT_RATE = float(os.getenv("ANS_CASCADE_AUDIT_RATE", "0.02"))
+        # Build agents and load puzzles in a background thread at startup (off: on first use)
+        self.PRELOAD = env_bool("PRELOAD", True)
+        # Shared HTTP connection pool for model calls
+        self.HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+        self.HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+        self.HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "600"))
+        self.HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+        self.HTTP_WARMUP = env_bool("HTTP_WARMUP", True)
+        # Per-request deadline (0 disables), hedged duplicate after this latency
+        # percentile of recent requests (0 disables), optionally to HEDGE_MODEL
+        self.MODEL_DEADLINE = float(os.getenv("MODEL_DEADLINE", "60"))
+        self.HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+        self.HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "2"))
+        self.HEDGE_MODEL = os.getenv("HEDGE_MODEL", "")
+        # Circuit breaker: open at this error rate over the window, probe after the cooldown
+        self.BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+        self.BREAKER_MIN_REQUESTS = int(os.getenv("BREAKER_MIN_REQUESTS", "10"))
+        self.BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "60"))
+        self.BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+        # Micro-batching of judge requests (window 0 disables)
+        self.JUDGE_BATCH_WINDOW_MS = float(os.getenv("JUDGE_BATCH_WINDOW_MS", "0"))
+        self.JUDGE_BATCH_MAX = int(os.getenv("JUDGE_BATCH_MAX", "8"))
+        # Local pre-classifier and the traffic log it is trained from
+        self.CLASSIFIER_ENABLED = env_bool("CLASSIFIER_ENABLED", True)
+        self.CLASSIFIER_MODEL = os.getenv("CLASSIFIER_MODEL", os.path.join(self.BASE_DIR, "classifier.json"))
+        self.CLASSIFIER_THRESHOLD = float(os.getenv("CLASSIFIER_THRESHOLD", "0.97"))
+        self.TRAFFIC_LOG = os.getenv("TRAFFIC_LOG", "")
+        # Judge questions and answers on the async runner instead of the request thread
+        self.ASYNC_MODE = env_bool("ASYNC_MODE")
+        # Per-room command queue: judgments run at once, queued commands in total and per speaker
+        self.ROOM_PARALLELISM = int(os.getenv("ROOM_PARALLELISM", "1"))
+        self.ROOM_QUEUE_MAX = int(os.getenv("ROOM_QUEUE_MAX", "32"))
+        self.ROOM_QUEUE_PER_SPEAKER = int(os.getenv("ROOM_QUEUE_PER_SPEAKER", "4"))
+        # Rate limits on ask/answer commands as "COUNT/SECONDS" (empty disables)
+        self.RATE_LIMIT_SPEAKER = os.getenv("RATE_LIMIT_SPEAKER", "10/60")
+        self.RATE_LIMIT_IP = os.getenv("RATE_LIMIT_IP", "30/60")
+        self.RATE_LIMIT_ROOM = os.getenv("RATE_LIMIT_ROOM", "120/60")
+        self.RATE_LIMIT_GLOBAL = os.getenv("RATE_LIMIT_GLOBAL", "")
+        # Speculative judging of drafts while players type (opt-in): judgments each
+        # player and IP may start as "COUNT/SECONDS", running at once per process,
+        # and unsubmitted drafts kept per room
+        self.SPECULATION_ENABLED = env_bool("SPECULATION_ENABLED")
+        self.SPECULATION_BUDGET = os.getenv("SPECULATION_BUDGET", "20/300")
+        self.SPECULATION_MAX_INFLIGHT = int(os.getenv("SPECULATION_MAX_INFLIGHT", "8"))
+        self.SPECULATION_MAX_DRAFTS = int(os.getenv("SPECULATION_MAX_DRAFTS", "16"))
+        # Stream verdicts: publish the result as soon as it is parsed, then finish
+        # (or, with SKIP_REASONING, cut off) the reasoning in the background
+        self.STREAM_VERDICTS = env_bool("STREAM_VERDICTS")
+        self.SKIP_REASONING = env_bool("SKIP_REASONING")
+        # Verdict cache (size 0 disables, fuzzy 0 disables n-gram matching)
+        self.VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "5000"))
+        self.VERDICT_CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", "86400"))
+        self.VERDICT_CACHE_FUZZY = float(os.getenv("VERDICT_CACHE_FUZZY", "0"))
+        # Puzzle library: source file and SQLite store (":memory:" re-imports on start)
+        self.SOUP_FILE = os.getenv("SOUP_FILE", os.path.join(self.BASE_DIR, "soups.json"))
+        self.SOUP_DB = os.getenv("SOUP_DB", ":memory:")
+        # Offline FAQ index (python -m soup.faq build)
+        self.FAQ_INDEX = os.getenv("FAQ_INDEX", os.path.join(self.BASE_DIR, "faq.idx"))
+        self.FAQ_PROGRESS = os.getenv("FAQ_PROGRESS", os.path.join(self.BASE_DIR, "faq.jsonl"))
+        self.FAQ_MIN_CONFIDENCE = float(os.getenv("FAQ_MIN_CONFIDENCE", "1.0"))
+        # Seconds between checks of .env and SOUP_FILE for changes to hot-reload (0 disables)
+        self.RELOAD_WATCH_INTERVAL = float(os.getenv("RELOAD_WATCH_INTERVAL", "2"))
+        # Messages kept per game (0 keeps everything)
+        self.CHAT_RETENTION = int(os.getenv("CHAT_RETENTION", "500"))
+        # Durable game state (empty STATE_DIR disables the journal)
+        self.STATE_DIR = os.getenv("STATE_DIR", "")
+        self.JOURNAL_FSYNC_MS = float(os.getenv("JOURNAL_FSYNC_MS", "50"))
+        self.JOURNAL_SNAPSHOT_EVERY = int(os.getenv("JOURNAL_SNAPSHOT_EVERY", "1000"))
+        # Game state shared by the worker processes (SQLite path, empty keeps it in memory)
+        # and how often a worker looks for changes made by the others while streaming
+        self.SHARED_DB = os.getenv("SHARED_DB", "")
+        self.SHARED_POLL_INTERVAL = float(os.getenv("SHARED_POLL_INTERVAL", "0.2"))
+        # Production server: worker processes (0 runs the development server)
+        self.WEB_WORKERS = int(os.getenv("WEB_WORKERS", "0"))
+        # Rooms
+        self.MAX_ROOMS = int(os.getenv("MAX_ROOMS", "10000"))
+        self.ROOM_IDLE_TTL = float(os.getenv("ROOM_IDLE_TTL", "3600"))
+        self.ROOM_GC_INTERVAL = float(os.getenv("ROOM_GC_INTERVAL", "60"))
 
 config = Config()
\ No newline at end of file
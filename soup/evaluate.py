@@ -0,0 +1,280 @@
+"""Offline accuracy and latency evaluation of the judge and answer agents
+
+    python -m soup.evaluate cases.jsonl --model agent/deepseek-v3.2(free) --model other-model
+
+Each line of the cases file is one labeled case:
+
+    {"puzzle_id": 3, "kind": "ask", "input": "他是自杀的吗", "expected": "否"}
+    {"puzzle": {"question": "...", "answer": "..."}, "kind": "ans", "input": "...", "expected": "正确"}
+
+Cases run with bounded concurrency against every model config and are scored
+with accuracy, a confusion matrix, latency percentiles and tokens per case.
+Model responses are cached on disk keyed by the exact prompt, so a re-run
+after a prompt change only calls the model for the cases whose prompt changed.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from pydantic_ai.messages import ModelMessagesTypeAdapter, ModelResponse
+from pydantic_ai.models.wrapper import WrapperModel
+
+from soup.config import config, logger
+from soup.runner import runner
+
+LABELS = {"ask": ("是", "否", "不相关"), "ans": ("正确", "错误")}
+DEFAULT_CACHE = os.path.join(config.BASE_DIR, "eval_cache.sqlite")
+
+# Cache hits and model calls of the case running on the current task
+_case_calls: ContextVar[Counter] = ContextVar("soup_eval_case_calls", default=None)
+
+
+def read_cases(path: str, store=None) -> List[Dict]:
+    """Load and validate labeled cases, resolving puzzle_id through the puzzle store"""
+    cases = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            if "puzzle" not in case:
+                if store is None:
+                    from soup.store import PuzzleStore
+                    store = PuzzleStore.from_config()
+                case["puzzle"] = store.get(case["puzzle_id"])
+            kind = case.get("kind", "ask")
+            if case.get("puzzle") is None or kind not in LABELS or case.get("expected") not in LABELS[kind]:
+                raise ValueError(f"{path}:{number}: invalid case")
+            case.setdefault("id", number)
+            case["kind"] = kind
+            cases.append(case)
+    return cases
+
+
+def prompt_fingerprint(model_name: str, messages, parameters) -> str:
+    """Hash of everything that determines a response, ignoring timestamps and call IDs"""
+    payload = [model_name]
+    for message in messages:
+        payload.append(getattr(message, "instructions", None))
+        for part in message.parts:
+            payload.append([
+                part.part_kind,
+                getattr(part, "content", None),
+                getattr(part, "tool_name", None),
+                getattr(part, "args", None),
+            ])
+    payload.append([(tool.name, tool.parameters_json_schema) for tool in parameters.output_tools])
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Model responses on disk (SQLite), keyed by prompt fingerprint"""
+
+    def __init__(self, path: str):
+        # Created here, used from the runner loop thread only
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response BLOB NOT NULL)")
+
+    def get(self, key: str) -> Optional[ModelResponse]:
+        row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        return ModelMessagesTypeAdapter.validate_json(row[0])[0] if row else None
+
+    def put(self, key: str, response: ModelResponse) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)",
+                (key, ModelMessagesTypeAdapter.dump_json([response])),
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class CachingModel(WrapperModel):
+    """Answers from the response cache when the exact prompt was seen before"""
+
+    def __init__(self, wrapped, cache: ResponseCache):
+        super().__init__(wrapped)
+        self.cache = cache
+
+    async def request(self, messages, model_settings, model_request_parameters):
+        key = prompt_fingerprint(self.model_name, messages, model_request_parameters)
+        calls = _case_calls.get()
+        cached = self.cache.get(key)
+        if cached is not None:
+            if calls is not None:
+                calls["cached"] += 1
+            return cached
+        response = await self.wrapped.request(messages, model_settings, model_request_parameters)
+        if calls is not None:
+            calls["fresh"] += 1
+        self.cache.put(key, response)
+        return response
+
+
+class Evaluator:
+    """Runs labeled cases against one model config with bounded concurrency"""
+
+    def __init__(self, name: str, judge_model: str, answer_model: str, cache: ResponseCache, concurrency: int = 8):
+        from soup.agents import create_answer_agent, create_judge_agent
+        from soup.agents.clients import get_model
+
+        self.name = name
+        self.agents = {
+            "ask": create_judge_agent(judge_model),
+            "ans": create_answer_agent(answer_model),
+        }
+        self.models = {
+            "ask": CachingModel(get_model(judge_model), cache),
+            "ans": CachingModel(get_model(answer_model), cache),
+        }
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(self, cases: List[Dict]) -> List[Dict]:
+        return await asyncio.gather(*(self._run_case(case) for case in cases))
+
+    async def _run_case(self, case: Dict) -> Dict:
+        from soup.agents.dep import SoupState
+
+        kind = case["kind"]
+        row = {"id": case["id"], "kind": kind, "expected": case["expected"]}
+        async with self._semaphore:
+            calls = Counter()
+            _case_calls.set(calls)
+            started = time.perf_counter()
+            try:
+                result = await self.agents[kind].run(
+                    case["input"],
+                    deps=SoupState(running=True, current_soup=case["puzzle"]),
+                    model=self.models[kind],
+                )
+            except Exception as e:
+                logger.warning(f"[{self.name}] case {case['id']} failed: {e}")
+                row.update(predicted="error", correct=False, error=str(e))
+                return row
+            latency = time.perf_counter() - started
+
+        usage = result.usage()
+        row.update(
+            predicted=result.output.result,
+            correct=result.output.result == case["expected"],
+            latency=latency,
+            cached=calls["fresh"] == 0,
+            input_tokens=usage.input_tokens,
+            cached_tokens=usage.cache_read_tokens,
+            output_tokens=usage.output_tokens,
+        )
+        return row
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarize(rows: List[Dict]) -> Dict:
+    """Accuracy, confusion matrix, latency and tokens per agent kind"""
+    by_kind = defaultdict(list)
+    for row in rows:
+        by_kind[row["kind"]].append(row)
+
+    summary = {}
+    for kind, kind_rows in sorted(by_kind.items()):
+        labels = LABELS[kind] + ("error",)
+        confusion = {
+            expected: {predicted: 0 for predicted in labels} for expected in LABELS[kind]
+        }
+        for row in kind_rows:
+            confusion[row["expected"]][row["predicted"]] += 1
+
+        answered = [row for row in kind_rows if row["predicted"] != "error"]
+        # Cache hits say nothing about the model's speed
+        latencies = [row["latency"] for row in answered if not row["cached"]]
+        summary[kind] = {
+            "cases": len(kind_rows),
+            "accuracy": round(sum(row["correct"] for row in kind_rows) / len(kind_rows), 4),
+            "errors": len(kind_rows) - len(answered),
+            "cached": sum(row["cached"] for row in answered),
+            "confusion": confusion,
+            "latency_ms": {
+                f"p{p}": round(percentile(latencies, p) * 1000, 1) for p in (50, 90, 99)
+            },
+            "tokens_per_case": {
+                "input": round(sum(row["input_tokens"] for row in answered) / max(1, len(answered)), 1),
+                "cached": round(sum(row["cached_tokens"] for row in answered) / max(1, len(answered)), 1),
+                "output": round(sum(row["output_tokens"] for row in answered) / max(1, len(answered)), 1),
+            },
+        }
+    return summary
+
+
+def print_report(name: str, summary: Dict) -> None:
+    print(f"== {name}")
+    for kind, stats in summary.items():
+        latency = stats["latency_ms"]
+        tokens = stats["tokens_per_case"]
+        print(
+            f"  {kind}: {stats['cases']} cases, accuracy {stats['accuracy']:.1%}, "
+            f"{stats['errors']} errors, {stats['cached']} cached"
+        )
+        print(
+            f"    latency p50={latency['p50']}ms p90={latency['p90']}ms p99={latency['p99']}ms, "
+            f"tokens/case in={tokens['input']} (cached {tokens['cached']}) out={tokens['output']}"
+        )
+        labels = list(next(iter(stats["confusion"].values())))
+        print("    expected \\ predicted  " + "  ".join(f"{label:>6}" for label in labels))
+        for expected, row in stats["confusion"].items():
+            print(f"    {expected:<20}" + "  ".join(f"{row[label]:>6}" for label in labels))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the judge and answer agents on labeled cases")
+    parser.add_argument("cases", help="Labeled cases (JSONL)")
+    parser.add_argument(
+        "--model", action="append", dest="models",
+        help="Model for both agents, repeatable; default is JUDGE_MODEL / ANS_MODEL",
+    )
+    parser.add_argument("--concurrency", type=int, default=8, help="Cases in flight per model")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="Response cache (SQLite)")
+    parser.add_argument("--output", help="Write the summaries as JSON")
+    parser.add_argument("--details", help="Write per-case results as JSONL")
+    args = parser.parse_args()
+
+    cases = read_cases(args.cases)
+    configs = [(name, name, name) for name in args.models] if args.models else [
+        ("default", config.JUDGE_MODEL, config.ANS_MODEL)
+    ]
+    cache = ResponseCache(args.cache)
+
+    report = {}
+    details = []
+    for name, judge_model, answer_model in configs:
+        evaluator = Evaluator(name, judge_model, answer_model, cache, args.concurrency)
+        # The shared runner loop owns the pooled HTTP client
+        rows = runner.run(evaluator.run(cases))
+        report[name] = summarize(rows)
+        details.extend(dict(row, model=name) for row in rows)
+        print_report(name, report[name])
+    cache.close()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.details:
+        with open(args.details, "w", encoding="utf-8") as f:
+            for row in details:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
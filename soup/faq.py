@@ -0,0 +1,233 @@
+"""Offline FAQ index: precomputed judge verdicts for likely questions
+
+Build with:
+    python -m soup.faq build --concurrency 8 --votes 3
+
+The builder appends one JSON line per finished puzzle to a progress file,
+so an interrupted run resumes where it stopped. The compiled index is a
+sorted array of fixed-size records that SoupFlow memory-maps at startup.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import struct
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+from soup.agents.judge_agent import JudgeOutput
+from soup.cache import normalize_question, puzzle_key
+from soup.config import config, logger
+
+MAGIC = b"SOUPFAQ1"
+HEADER = struct.Struct("<8sI")
+# puzzle hash, question hash, verdict code, confidence (percent)
+RECORD = struct.Struct("<QQBB")
+VERDICTS = ("是", "否", "不相关")
+
+
+def _puzzle_hash(soup: Dict) -> int:
+    return int(puzzle_key(soup), 16)
+
+
+def _question_hash(question: str) -> int:
+    digest = hashlib.blake2b(normalize_question(question).encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "little")
+
+
+class FaqIndex:
+    """Read-only, memory-mapped lookup of precomputed verdicts"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # What the mapping was made from, see `changed`
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        magic, self.count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a FAQ index: {path}")
+
+    @classmethod
+    def load(cls, path: str = None) -> Optional["FaqIndex"]:
+        """Open the index if it exists, None otherwise"""
+        path = path or config.FAQ_INDEX
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            index = cls(path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.error(f"Failed to load FAQ index {path}: {e}")
+            return None
+        logger.info(f"FAQ index loaded: {index.count} entries ({path})")
+        return index
+
+    def __len__(self) -> int:
+        return self.count
+
+    def changed(self) -> bool:
+        """Whether the file on disk is no longer the one mapped (rebuilt or removed)"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return (stat.st_mtime_ns, stat.st_size) != self.signature
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def lookup(self, soup: Dict, question: str, min_confidence: float = None) -> Optional[JudgeOutput]:
+        """Binary-search the index for a confident verdict on this question"""
+        if not soup or not self.count:
+            return None
+        if min_confidence is None:
+            min_confidence = config.FAQ_MIN_CONFIDENCE
+
+        target = (_puzzle_hash(soup), _question_hash(question))
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            try:
+                p_hash, q_hash, verdict, confidence = RECORD.unpack_from(
+                    self._mm, HEADER.size + mid * RECORD.size
+                )
+            except ValueError:
+                # Closed by a reload that swapped in a new index: the model decides
+                return None
+            if (p_hash, q_hash) < target:
+                lo = mid + 1
+            elif (p_hash, q_hash) > target:
+                hi = mid
+            else:
+                if confidence < min_confidence * 100:
+                    return None
+                return JudgeOutput(
+                    result=VERDICTS[verdict],
+                    reasoning=f"FAQ 索引命中（一致率 {confidence}%）",
+                )
+        return None
+
+
+def write_index(path: str, entries: Iterable[Dict]) -> int:
+    """Compile progress entries into a sorted binary index. Returns the record count."""
+    records = {}
+    for entry in entries:
+        p_hash = int(entry["puzzle"], 16)
+        for item in entry["items"]:
+            key = (p_hash, _question_hash(item["question"]))
+            record = (VERDICTS.index(item["result"]), int(round(item["confidence"] * 100)))
+            # Keep the most confident verdict when two questions normalize alike
+            if key not in records or records[key][1] < record[1]:
+                records[key] = record
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(records)))
+        for (p_hash, q_hash), (verdict, confidence) in sorted(records.items()):
+            f.write(RECORD.pack(p_hash, q_hash, verdict, confidence))
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+def read_progress(path: str) -> list:
+    """Read finished puzzles from the progress file, skipping a torn last line"""
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning("Skipping incomplete line in FAQ progress file")
+    return entries
+
+
+class FaqBuilder:
+    """Generates likely questions per puzzle and judges them, puzzles in parallel"""
+
+    def __init__(self, progress_path: str, concurrency: int = 8, votes: int = 3):
+        from soup.agents import create_faq_agent, create_judge_agent
+
+        self.progress_path = progress_path
+        self.votes = votes
+        self.faq_agent = create_faq_agent()
+        self.judge_agent = create_judge_agent()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._write_lock = asyncio.Lock()
+
+    async def build(self, soups: list) -> int:
+        """Process every puzzle not yet in the progress file. Returns the number processed."""
+        done = {entry["puzzle"] for entry in read_progress(self.progress_path)}
+        todo = [soup for soup in soups if puzzle_key(soup) not in done]
+        logger.info(f"FAQ build: {len(done)} puzzles done, {len(todo)} to go")
+
+        results = await asyncio.gather(
+            *(self._build_puzzle(soup) for soup in todo), return_exceptions=True
+        )
+        failed = [r for r in results if isinstance(r, Exception)]
+        for error in failed:
+            logger.error(f"FAQ build failed for a puzzle: {error}")
+        return len(todo) - len(failed)
+
+    async def _build_puzzle(self, soup: Dict) -> None:
+        from soup.agents.dep import SoupState
+
+        async with self._semaphore:
+            deps = SoupState(running=True, current_soup=soup)
+            generated = await self.faq_agent.run("请列出玩家最可能提出的问题", deps=deps)
+
+            questions = list(dict.fromkeys(q.strip() for q in generated.output.questions if q.strip()))
+            items = await asyncio.gather(*(self._judge(q, deps) for q in questions))
+
+        entry = {"puzzle": puzzle_key(soup), "items": [item for item in items if item]}
+        async with self._write_lock:
+            with open(self.progress_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        logger.info(f"FAQ puzzle {entry['puzzle']}: {len(entry['items'])} questions")
+
+    async def _judge(self, question: str, deps) -> Optional[Dict]:
+        """Judge a question several times; agreement across votes is the confidence"""
+        runs = await asyncio.gather(
+            *(self.judge_agent.run(question, deps=deps) for _ in range(self.votes)),
+            return_exceptions=True,
+        )
+        verdicts = Counter(r.output.result for r in runs if not isinstance(r, Exception))
+        if not verdicts:
+            return None
+        result, count = verdicts.most_common(1)[0]
+        return {"question": question, "result": result, "confidence": count / self.votes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline FAQ index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Generate and judge questions, then compile the index")
+    build.add_argument("--concurrency", type=int, default=8, help="Puzzles processed in parallel")
+    build.add_argument("--votes", type=int, default=3, help="Judge runs per question")
+
+    sub.add_parser("compile", help="Compile the index from the progress file only")
+
+    for p in (build, sub.choices["compile"]):
+        p.add_argument("--progress", default=config.FAQ_PROGRESS, help="Resumable progress file (JSONL)")
+        p.add_argument("--output", default=config.FAQ_INDEX, help="Index file")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from soup.store import PuzzleStore
+
+        soups = list(PuzzleStore.from_config())
+        builder = FaqBuilder(args.progress, concurrency=args.concurrency, votes=args.votes)
+        asyncio.run(builder.build(soups))
+
+    count = write_index(args.output, read_progress(args.progress))
+    logger.info(f"FAQ index written: {count} entries ({args.output})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,97 +1,468 @@
-import json
-import os
-import random
-from typing import Dict, Union
+import asyncio
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import CancelledError
+from typing import TYPE_CHECKING, Dict, NamedTuple, Optional, Union
 
-from rich.console import Console
-from rich.text import Text
-
-from soup.agents import create_judge_agent, create_answer_agent
+from soup.agents.answer_agent import AnswerJudgeOutput
 from soup.agents.dep import SoupState
+from soup.agents.judge_agent import JudgeOutput
+from soup.cache import VerdictCache
+from soup.chatlog import ChatLog
+from soup.classifier import PreClassifier, log_traffic
+from soup.faq import FaqIndex
 from soup.config import config, logger
+from soup import metrics
+from soup.runner import runner
+from soup.scheduler import RoomScheduler
+from soup.speculation import Speculator
+from soup.store import PuzzleStore
 
+if TYPE_CHECKING:
+    from rich.console import Console
+
+
+# Guards lazy creation of per-game condition variables and speculators
+_CONDITION_INIT_LOCK = threading.Lock()
+# Guards the in-flight counters of async judgments
+_PENDING_LOCK = threading.Lock()
+# Ticket numbers for async judgments
+_TICKETS = itertools.count(1)
+# Streams still finishing their reasoning after the verdict was published
+_BACKGROUND_STREAMS = set()
+
+
+# Settings the agents are built from: changing one of them rebuilds the agents on reload
+AGENT_SETTINGS = frozenset({
+    "CHERRYIN_KEY", "MODEL_BASE_URL", "JUDGE_MODEL", "ANS_MODEL", "HEDGE_MODEL",
+    "JUDGE_CHEAP_MODEL", "JUDGE_CASCADE_MIN_CONFIDENCE", "JUDGE_CASCADE_AUDIT_RATE",
+    "ANS_CHEAP_MODEL", "ANS_CASCADE_MIN_CONFIDENCE", "ANS_CASCADE_AUDIT_RATE",
+    "JUDGE_BATCH_WINDOW_MS", "JUDGE_BATCH_MAX",
+})
+VERDICT_CACHE_SETTINGS = frozenset({"VERDICT_CACHE_SIZE", "VERDICT_CACHE_TTL", "VERDICT_CACHE_FUZZY"})
+
+
+class Agents(NamedTuple):
+    """The AI agents built from one configuration"""
+    judge_agent: object
+    answer_agent: object
+    judge_cascade: Optional[object]
+    answer_cascade: Optional[object]
+    judge_batcher: Optional[object]
+
+
+class SoupResources:
+    """Resources shared by every game: AI agents, puzzles and console
+
+    Agents, the puzzle store and the console are built on first use, so
+    startup doesn't wait for pydantic-ai or rich; with PRELOAD a background
+    thread builds the agents and the store early.
+    """
 
-class SoupFlow:
-    """Main game flow controller for Lateral Thinking Puzzles (海龟汤)"""
-    
     def __init__(self):
+        self.verdict_cache = None
+        self.faq_index = None
+        self._store = None
+        self._agents = None
+        self._console = None
+        self._lock = threading.RLock()
+        # Serializes reloads from /reload and the file watcher
+        self._reload_lock = threading.Lock()
         self.reload()
+        if config.PRELOAD:
+            threading.Thread(target=self.preload, name="soup-preload", daemon=True).start()
+
+    def reload(self) -> None:
+        """Apply configuration and puzzle changes; games in progress are not touched
+
+        Agents are rebuilt only when a setting they are built from changed.
+        New objects are built first and then swapped in, so calls already
+        running finish with the agents they started with.
+        """
+        with self._reload_lock:
+            changed = config.reload()
+            self.classifier = PreClassifier() if config.CLASSIFIER_ENABLED else None
+            self._reload_faq_index()
+
+            rebuild = bool(changed & AGENT_SETTINGS) and self._agents is not None
+            if self.verdict_cache is None or changed & VERDICT_CACHE_SETTINGS:
+                self.verdict_cache = VerdictCache()
+            elif changed & AGENT_SETTINGS:
+                # Verdicts may change with the models
+                self.verdict_cache.clear()
+            if rebuild:
+                # Built before the swap: requests keep using the old agents meanwhile
+                agents = self._build_agents()
+                with self._lock:
+                    self._agents = agents
+
+            # A loaded store picks up puzzle file changes, otherwise it loads on first use
+            if self._store is not None:
+                if changed & {"SOUP_FILE", "SOUP_DB"}:
+                    store = PuzzleStore.from_config()
+                    with self._lock:
+                        self._store = store
+                else:
+                    self._store.sync_file(config.SOUP_FILE)
+
+        logger.info(
+            f"Configuration reloaded (changed: {', '.join(sorted(changed)) or 'nothing'}; "
+            f"agents {'rebuilt' if rebuild else 'kept'})"
+        )
+
+    def _reload_faq_index(self) -> None:
+        """Map the FAQ index again only if its file changed, then close the old mapping"""
+        old = self.faq_index
+        if old is not None and old.path == config.FAQ_INDEX and not old.changed():
+            return
+        self.faq_index = FaqIndex.load()
+        if old is not None:
+            old.close()
+
+    def preload(self) -> None:
+        """Build the agents and load the puzzles now instead of on first use"""
+        started = time.perf_counter()
+        self.agents
+        self.store
+        logger.info(f"Agents and puzzles preloaded in {time.perf_counter() - started:.2f}s")
+
+    @property
+    def agents(self) -> Agents:
+        agents = self._agents
+        if agents is None:
+            with self._lock:
+                agents = self._agents
+                if agents is None:
+                    agents = self._agents = self._build_agents()
+        return agents
+
+    @staticmethod
+    def _build_agents() -> Agents:
+        from soup.agents import create_answer_agent, create_judge_agent
+        from soup.agents.batch_agent import JudgeBatcher
+        from soup.agents.cascade import create_answer_cascade, create_judge_cascade
+        from soup.agents.clients import warm_up
+
+        judge_agent = create_judge_agent()
+        answer_agent = create_answer_agent()
+        judge_batcher = None
+        if config.JUDGE_BATCH_WINDOW_MS > 0:
+            judge_batcher = JudgeBatcher(judge_agent)
+        # Open a pooled provider connection before the first question
+        if config.HTTP_WARMUP:
+            runner.submit(warm_up())
+        return Agents(
+            judge_agent,
+            answer_agent,
+            create_judge_cascade(judge_agent, judge_batcher),
+            create_answer_cascade(answer_agent),
+            judge_batcher,
+        )
+
+    @property
+    def judge_agent(self):
+        return self.agents.judge_agent
+
+    @property
+    def answer_agent(self):
+        return self.agents.answer_agent
+
+    @property
+    def judge_cascade(self):
+        return self.agents.judge_cascade
+
+    @property
+    def answer_cascade(self):
+        return self.agents.answer_cascade
+
+    @property
+    def judge_batcher(self):
+        return self.agents.judge_batcher
+
+    @property
+    def store(self) -> PuzzleStore:
+        store = self._store
+        if store is None:
+            with self._lock:
+                store = self._store
+                if store is None:
+                    store = self._store = PuzzleStore.from_config()
+        return store
+
+    @property
+    def console(self) -> "Console":
+        """Console for CLI output"""
+        console = self._console
+        if console is None:
+            with self._lock:
+                console = self._console
+                if console is None:
+                    from rich.console import Console
+
+                    console = self._console = Console()
+        return console
+
+
+class SoupFlow:
+    """Main game flow controller for Lateral Thinking Puzzles (海龟汤)"""
+
+    # Many idle rooms are kept in memory, so per-game state stays small
+    __slots__ = (
+        "resources",
+        "room_id",
+        "journal",
+        "shared",
+        "_shared_version",
+        "_sync_lock",
+        "game_state",
+        "chat_history",
+        "version",
+        "last_active",
+        "deck",
+        "_ai_running",
+        "_pending",
+        "_changed",
+        "scheduler",
+        "_speculator",
+    )
+
+    def __init__(self, resources: SoupResources = None, room_id: str = "default", journal=None, shared=None):
+        self.resources = resources or SoupResources()
+        # Optional write-ahead log of state changes (see soup.journal)
+        self.room_id = room_id
+        self.journal = journal
+        # Optional state shared with other server processes (see soup.shared)
+        self.shared = shared
+        self._shared_version = None
+        # Serializes applying pulled changes to this room only
+        self._sync_lock = threading.Lock() if shared is not None else None
+        # Change notification for push clients (SSE), created on first wait
+        self._changed = None
+        self.version = 0
+        self._ai_running = False
+        self._pending = 0
+        # Fair queue of this room's ask/answer commands
+        self.scheduler = RoomScheduler()
+        # Judgments of drafts still being typed, created on the first draft
+        self._speculator = None
+        self.last_active = time.monotonic()
+        self.deck = None
+        if shared is None:
+            self.reset()
+        else:
+            # Another worker may already be playing in this room: adopt its game
+            self.chat_history = ChatLog(config.CHAT_RETENTION)
+            self.game_state = {"game_id": 0, "running": False, "current_soup": None}
+            shared.touch(room_id)
+            self.sync()
+
+    @property
+    def judge_agent(self):
+        return self.resources.judge_agent
+
+    @property
+    def answer_agent(self):
+        return self.resources.answer_agent
+
+    @property
+    def store(self) -> PuzzleStore:
+        return self.resources.store
+
+    @property
+    def console(self) -> "Console":
+        return self.resources.console
 
     def reload(self):
-        """Reload configuration and puzzles"""
-        config.reload()
-        # AI agents
-        self.judge_agent = create_judge_agent()
-        self.answer_agent = create_answer_agent()
-        
-        # Game state
+        """Reload configuration and puzzles, keeping the game in progress"""
+        self.resources.reload()
+
+    def reset(self):
+        """Reset game state"""
         self.ai_running = False
-        self.chat_history = []
+        if self.shared is not None:
+            self.shared.reset(self.room_id)
+            self.sync()
+            return
+        self.chat_history = ChatLog(config.CHAT_RETENTION)
         self.game_state = {
             "game_id": 0,
             "running": False,
             "current_soup": None,
         }
-        
-        # Load puzzles
-        self.soups = self._load_soups()
-        
-        # Console for CLI output
-        self.console = Console()
-        logger.info("Configuration and soups reloaded")
-    
-    def _load_soups(self) -> list:
-        """Load soup puzzles from JSON file"""
-        soup_path = os.path.join(config.BASE_DIR, "soups.json")
-        try:
-            with open(soup_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            logger.error(f"Soups file not found: {soup_path}")
-            return []
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON in soups file: {e}")
-            return []
+        self._record("reset")
+        self._notify()
+
+    def snapshot(self) -> Dict:
+        """Plain, JSON-serializable copy of the game state"""
+        first_seq, messages = self.chat_history.dump()
+        return {
+            "game_id": self.game_state["game_id"],
+            "running": self.game_state["running"],
+            "current_soup": self.game_state["current_soup"],
+            "first_seq": first_seq,
+            "messages": messages,
+        }
+
+    def restore(self, state: Dict) -> None:
+        """Load state produced by `snapshot()` or journal recovery"""
+        self.game_state = {
+            "game_id": state["game_id"],
+            "running": state["running"],
+            "current_soup": state["current_soup"],
+        }
+        self.chat_history = ChatLog.restore(
+            state["first_seq"], state["messages"], config.CHAT_RETENTION
+        )
+        self._notify()
+
+    def sync(self) -> bool:
+        """Pull changes other workers made to the shared state. Returns True if any."""
+        if self.shared is None:
+            return False
+        # Lock-free check first: polls of an unchanged room read one row and return
+        if self.shared.version(self.room_id) == self._shared_version:
+            return False
+        with self._sync_lock:
+            changes = self.shared.changes(
+                self.room_id, self._shared_version, self.game_state["game_id"], self.chat_history.next_seq
+            )
+            if changes is None:
+                return False
+            self.game_state = {
+                "game_id": changes["game_id"],
+                "running": changes["running"],
+                "current_soup": changes["current_soup"],
+            }
+            if changes["full"]:
+                self.chat_history = ChatLog.restore(
+                    changes["first_seq"], changes["messages"], config.CHAT_RETENTION
+                )
+            else:
+                for sayer, content in changes["messages"]:
+                    self.chat_history.append(sayer, content)
+            self._shared_version = changes["version"]
+        self._notify()
+        return True
+
+    def _record(self, kind: str, **data) -> None:
+        if self.journal is not None:
+            self.journal.record(self.room_id, kind, **data)
+
+    def touch(self) -> None:
+        """Mark the game as recently used"""
+        self.last_active = time.monotonic()
+
+    @property
+    def ai_running(self) -> bool:
+        return self._ai_running
+
+    @ai_running.setter
+    def ai_running(self, value: bool) -> None:
+        if self._ai_running != value:
+            self._ai_running = value
+            self._notify()
+
+    def _notify(self) -> None:
+        """Bump the state version and wake up clients waiting for changes"""
+        self.version += 1
+        changed = self._changed
+        if changed is not None:
+            with changed:
+                changed.notify_all()
+
+    def wait_for_change(self, since_version: int, timeout: float) -> int:
+        """Block until the state version differs from `since_version` or timeout expires"""
+        if self._changed is None:
+            with _CONDITION_INIT_LOCK:
+                if self._changed is None:
+                    self._changed = threading.Condition()
+        if self.shared is None:
+            with self._changed:
+                self._changed.wait_for(lambda: self.version != since_version, timeout)
+                return self.version
+
+        # Other workers can't notify this process: poll the shared state meanwhile
+        deadline = time.monotonic() + timeout
+        while self.version == since_version:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.sync():
+                break
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: self.version != since_version, min(remaining, config.SHARED_POLL_INTERVAL)
+                )
+        return self.version
     
-    def get_random_soup(self) -> Dict:
-        """Select a random puzzle"""
-        if not self.soups:
-            logger.error("No soups available!")
-            return {"question": "Error: No puzzles loaded", "answer": "N/A"}
-        new_soup = random.choice(self.soups)
-        while new_soup == self.game_state.get("current_soup"):
-            new_soup = random.choice(self.soups)
+    def get_random_soup(self, tags: tuple = (), difficulty: int = None) -> Optional[Dict]:
+        """Select a random puzzle this game hasn't played in the current round, None if none matches"""
+        new_soup, self.deck = self.store.pick(self.deck, tuple(tags), difficulty)
+        if new_soup is None:
+            logger.error(f"No soups available (tags={list(tags)}, difficulty={difficulty})")
         return new_soup
     
     def add_message(self, speaker: str, content: str) -> None:
         """Add a message to chat history"""
-        self.chat_history.append({
-            'sayer': speaker,
-            'content': content
-        })
+        if self.shared is not None:
+            self.shared.append_message(self.room_id, self.game_state["game_id"], speaker, content)
+            self.sync()
+            return
+        record = self.chat_history.append(speaker, content)
+        self._record(
+            "message",
+            game_id=self.game_state["game_id"],
+            seq=record.seq,
+            sayer=speaker,
+            content=content,
+        )
+        self._notify()
     
-    def start_new_game(self) -> None:
-        """Start a new game with a random puzzle"""
+    def start_new_game(self, tags: tuple = (), difficulty: int = None) -> bool:
+        """Start a new game with a random puzzle, optionally filtered by tags or difficulty
+
+        Returns False, leaving the current game running, if no puzzle matches.
+        """
+        soup = self.get_random_soup(tags, difficulty)
+        if soup is None:
+            return False
         self.end_game()
-        
-        self.game_state["game_id"] += 1
-        self.game_state["running"] = True
-        self.game_state["current_soup"] = self.get_random_soup()
+
+        if self.shared is not None:
+            # The game ID is assigned by the shared store, unique across workers
+            self.shared.start_game(self.room_id, soup)
+            self.sync()
+        else:
+            self.game_state["game_id"] += 1
+            self.game_state["running"] = True
+            self.game_state["current_soup"] = soup
+            self._record("start", game_id=self.game_state["game_id"], soup=soup)
         
         question = self.game_state['current_soup']['question']
         msg = f"新游戏开始了: {question}"
         
         self.add_message('主持人', msg)
         logger.info(f"Game #{self.game_state['game_id']} started: {question}")
+        return True
     
     def end_game(self) -> None:
         """End the current game and reset state"""
         if self.game_state["running"]:
             logger.info(f"Game #{self.game_state['game_id']} ended")
         
+        # Commands still waiting for their turn belong to the game that just ended
+        self.scheduler.clear()
+        if self._speculator is not None:
+            self._speculator.clear()
+        if self.shared is not None:
+            self.shared.end_game(self.room_id)
+            self.sync()
+            return
         self.game_state["running"] = False
         self.game_state["current_soup"] = None
-        self.chat_history = []
+        self.chat_history = ChatLog(config.CHAT_RETENTION)
+        self._record("end", game_id=self.game_state["game_id"])
+        self._notify()
     
     def _extract_input(self, user_input: Union[str, Dict]) -> tuple[str, str]:
         """Extract content and speaker from input"""
@@ -111,107 +482,404 @@ class SoupFlow:
         response["speaker"] = speaker
         return response
     
-    def handle_ask(self, user_input: Union[str, Dict]):
-        """Handle a yes/no question from player"""
-        content, speaker = self._extract_input(user_input)
-        
-        # Check game state
-        if not self.game_state["running"]:
-            return self._create_response("游戏未运行，请先开始新游戏")
-        
-        # Set AI running flag
-        self.ai_running = True
-        
-        try:
-            # Add user question to chat
-            self.add_message(speaker, content)
-            
-            # Get AI judgment
-            judge_result = self.judge_agent.run_sync(
-                content,
-                deps=SoupState(**self.game_state)
-            )
-            
-            # Format response
-            judgment = judge_result.output.result
-            reasoning = judge_result.output.reasoning
-            
-            response_msg = f"判断：{judgment}"
+    def _publish_judgment(self, content: str, output) -> str:
+        """Post a judge verdict to the chat and log its reasoning"""
+        from rich.text import Text
+
+        judgment = output.result
+        reasoning = output.reasoning
+
+        response_msg = f"判断：{judgment}"
+        self.add_message('主持人', response_msg)
+
+        # Log detailed reasoning (CLI only); streamed verdicts log it when it arrives
+        full_msg = f"{response_msg}\n依据：{reasoning}" if reasoning else response_msg
+        self.console.print(Text(full_msg, style="bold blue"))
+        logger.info(f"Question: {content} -> {judgment}")
+
+        return response_msg
+
+    def _publish_answer(self, speaker: str, content: str, output, soup: Dict) -> str:
+        """Post an answer verdict to the chat and log its reasoning"""
+        from rich.text import Text
+
+        # Check if correct
+        if output.result == "正确":
+            correct_answer = soup['answer']
+            response_msg = f"🎉 恭喜你，猜对了！汤底是：{correct_answer}"
+
+            self.console.print(Text(response_msg, style="bold green"))
+            logger.info(f"Correct answer by {speaker}: {content}")
+
             self.add_message('主持人', response_msg)
-            
-            # Log detailed reasoning (CLI only)
-            full_msg = f"{response_msg}\n依据：{reasoning}"
-            self.console.print(Text(full_msg, style="bold blue"))
-            logger.info(f"Question: {content} -> {judgment}")
-            
-            return self._create_response(response_msg)
-            
-        except Exception as e:
-            logger.error(f"Error in handle_ask: {e}")
-            return self._create_response("处理问题时出错，请重试")
-        
-        finally:
-            self.ai_running = False
+            # self.end_game()
+
+        else:
+            reasoning = output.reasoning
+            response_msg = "很遗憾，回答错误"
+
+            full_msg = f"{response_msg}\n依据：{reasoning}" if reasoning else response_msg
+            self.console.print(Text(full_msg, style="bold yellow"))
+            logger.info(f"Wrong answer by {speaker}: {content}")
+
+            self.add_message('主持人', response_msg)
+
+        return response_msg
+
+    def _lookup_verdict(self, soup: Dict, content: str, count: bool = True):
+        """Find a known verdict in the FAQ index or the verdict cache, None on miss"""
+        faq_index = self.resources.faq_index
+        if faq_index is not None:
+            output = faq_index.lookup(soup, content)
+            if output is not None:
+                if count:
+                    metrics.VERDICTS.inc(1, "ask", "faq")
+                return output
+        output = self.resources.verdict_cache.get(soup, content)
+        if output is not None and count:
+            metrics.VERDICTS.inc(1, "ask", "cache")
+        return output
+
+    def _preclassify(self, kind: str, content: str, count: bool = True):
+        """Local verdict for obvious junk input, None if the model should decide"""
+        classifier = self.resources.classifier
+        if classifier is None:
+            return None
+        local = classifier.classify(kind, content)
+        if local is not None and count:
+            logger.info(f"Pre-classified {kind}: {content[:50]} -> {local[0]} ({local[1]})")
+            metrics.VERDICTS.inc(1, kind, "classifier")
+        return local
+
+    async def _judge(self, content: str, deps: SoupState, queued_at: float = None, speculative: bool = False):
+        """Judge a question: local junk filter, known verdicts, then the model
+
+        Speculative judgments of drafts are kept out of the verdict counters and
+        the traffic log; they count once the question is submitted.
+        """
+        if queued_at is not None:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - queued_at, "ask", "queue_wait")
+        count = not speculative
+        with metrics.STAGE_SECONDS.time("ask", "local"):
+            local = self._preclassify("ask", content, count)
+            output = None if local is not None else self._lookup_verdict(deps.current_soup, content, count)
+        if local is not None:
+            return JudgeOutput(result=local[0], reasoning=local[1])
+        if output is not None:
+            return output
+
+        # One snapshot: a reload meanwhile doesn't switch agents under this call
+        agents = self.resources.agents
+        with metrics.STAGE_SECONDS.time("ask", "model"):
+            # The cascade batches its escalations itself when batching is on
+            if agents.judge_cascade is not None:
+                output = await agents.judge_cascade.run(content, deps)
+            elif agents.judge_batcher is not None:
+                output = await agents.judge_batcher.judge(content, deps)
+            elif config.STREAM_VERDICTS:
+                return await self._stream_verdict(
+                    agents.judge_agent, "ask", content, deps,
+                    lambda full: self._remember_judgment(content, deps, full, speculative),
+                    # Cached right away, so a repeat doesn't wait for the reasoning
+                    on_verdict=lambda early: self.resources.verdict_cache.put(deps.current_soup, content, early),
+                )
+            else:
+                metrics.start_run("ask")
+                result = await agents.judge_agent.run(content, deps=deps)
+                metrics.record_run_usage("ask", deps.current_soup, result.usage())
+                output = result.output
+        self._remember_judgment(content, deps, output, speculative)
+        return output
+
+    def _remember_judgment(self, content: str, deps: SoupState, output, speculative: bool = False) -> None:
+        self.resources.verdict_cache.put(deps.current_soup, content, output)
+        if not speculative:
+            metrics.VERDICTS.inc(1, "ask", "model")
+            log_traffic("ask", content, output.result)
+
+    async def _evaluate(self, content: str, deps: SoupState, queued_at: float = None):
+        """Evaluate a solution attempt: local junk filter, then the model"""
+        if queued_at is not None:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - queued_at, "ans", "queue_wait")
+        with metrics.STAGE_SECONDS.time("ans", "local"):
+            local = self._preclassify("ans", content)
+        if local is not None:
+            return AnswerJudgeOutput(result=local[0], reasoning=local[1])
+
+        agents = self.resources.agents
+        with metrics.STAGE_SECONDS.time("ans", "model"):
+            if agents.answer_cascade is not None:
+                output = await agents.answer_cascade.run(content, deps)
+                self._remember_evaluation(content, output)
+                return output
+            if config.STREAM_VERDICTS:
+                return await self._stream_verdict(
+                    agents.answer_agent, "ans", content, deps,
+                    lambda full: self._remember_evaluation(content, full),
+                )
+            metrics.start_run("ans")
+            result = await agents.answer_agent.run(content, deps=deps)
+        metrics.record_run_usage("ans", deps.current_soup, result.usage())
+        self._remember_evaluation(content, result.output)
+        return result.output
+
+    def _remember_evaluation(self, content: str, output) -> None:
+        metrics.VERDICTS.inc(1, "ans", "model")
+        log_traffic("ans", content, output.result)
+
+    async def _stream_verdict(self, agent, kind: str, content: str, deps: SoupState, on_complete, on_verdict=None):
+        """Stream an agent's output and return as soon as its `result` field is parsed
+
+        The output schemas put `result` before `reasoning`, so the verdict is known
+        early and handed to `on_verdict` without reasoning. The stream keeps running
+        in the background to finish the reasoning, which is logged and handed to
+        `on_complete`; with SKIP_REASONING the stream is closed right away instead.
+        If the caller is cancelled before the verdict, e.g. a superseded draft,
+        the stream is cancelled too.
+        """
+        verdict = asyncio.get_running_loop().create_future()
+
+        async def consume():
+            metrics.start_run(kind)
+            output = None
+            try:
+                async with agent.run_stream(content, deps=deps) as stream:
+                    async for output in stream.stream_output(debounce_by=None):
+                        if not verdict.done():
+                            early = type(output)(result=output.result, reasoning="")
+                            verdict.set_result(early)
+                            if on_verdict is not None:
+                                on_verdict(early)
+                            if config.SKIP_REASONING:
+                                break
+                    if not config.SKIP_REASONING:
+                        output = await stream.get_output()
+                    metrics.record_run_usage(kind, deps.current_soup, stream.usage())
+            except Exception as e:
+                if not verdict.done():
+                    verdict.set_exception(e)
+                else:
+                    logger.warning(f"Reasoning stream for {content[:50]} failed: {e}")
+                return
+
+            if not verdict.done():
+                verdict.set_exception(ValueError("Stream ended without a verdict"))
+                return
+            if config.SKIP_REASONING:
+                output = verdict.result()
+            else:
+                from rich.text import Text
+
+                self.console.print(Text(f"{content} -> {output.result}\n依据：{output.reasoning}", style="dim"))
+            on_complete(output)
+
+        task = asyncio.create_task(consume())
+        _BACKGROUND_STREAMS.add(task)
+        task.add_done_callback(_BACKGROUND_STREAMS.discard)
+        try:
+            return await verdict
+        except asyncio.CancelledError:
+            # Nobody waits for this verdict: stop pulling tokens for it
+            task.cancel()
+            raise
+
+    def handle_ask(self, user_input: Union[str, Dict]):
+        """Handle a yes/no question from player, waiting for its turn and verdict"""
+        return self._handle(user_input, self._ask_async)
     
     def handle_answer(self, user_input: Union[str, Dict]):
-        """Handle a solution attempt from player"""
+        """Handle a solution attempt from player, waiting for its turn and verdict"""
+        return self._handle(user_input, self._answer_async)
+
+    def _handle(self, user_input: Union[str, Dict], handler):
+        response, admission = self._enqueue(user_input, handler)
+        if admission is None:
+            return response
+        try:
+            msg = admission.future.result()
+        except CancelledError:
+            msg = "游戏已结束，本条未判断"
+        except Exception as e:
+            logger.error(f"Error in ticket #{response['ticket']}: {e}")
+            msg = "处理时出错，请重试"
+        return self._create_response(msg)
+
+    # Async execution mode
+    def submit_ask(self, user_input: Union[str, Dict]):
+        """Accept a question and judge it in the background, returning a pending ticket"""
+        return self._submit(user_input, self._ask_async)
+
+    def submit_answer(self, user_input: Union[str, Dict]):
+        """Accept a solution attempt and judge it in the background, returning a pending ticket"""
+        return self._submit(user_input, self._answer_async)
+
+    def _submit(self, user_input: Union[str, Dict], handler):
+        response, admission = self._enqueue(user_input, handler)
+        if admission is not None:
+            if admission.position:
+                response["msg"] = f"已收到，排队中（前面还有 {admission.position} 条）..."
+            response["pending"] = True
+        return response
+
+    def _enqueue(self, user_input: Union[str, Dict], handler):
+        """Queue a command in this room's scheduler: (response, admission or None if refused)"""
         content, speaker = self._extract_input(user_input)
-        
+
         # Check game state
         if not self.game_state["running"]:
-            return self._create_response("游戏未运行，请先开始新游戏")
-        
-        # Set AI running flag
-        self.ai_running = True
-        
+            return self._create_response("游戏未运行，请先开始新游戏"), None
+
+        # Snapshot the game so a late verdict can't leak into the next one
+        ticket = next(_TICKETS)
+        game_id = self.game_state["game_id"]
+        deps = SoupState(**self.game_state)
+        queued_at = time.perf_counter()
+        # Only questions can reuse a speculation on their draft
+        speculated = handler == self._ask_async
+
+        admission = self.scheduler.submit(
+            speaker,
+            lambda: handler(ticket, game_id, speaker, content, deps, queued_at),
+            on_admit=lambda: self._admit(speaker, content, game_id if speculated else None),
+        )
+        if not admission.accepted:
+            retry_after = max(1, math.ceil(admission.wait))
+            response = self._create_response(f"排队已满，请 {retry_after} 秒后再试")
+            response["code"] = 1
+            response["retry_after"] = retry_after
+            response["queue_length"] = self.scheduler.queued
+            return response, None
+
+        admission.future.add_done_callback(
+            lambda future: self._settled(future, game_id if speculated else None, content)
+        )
+        response = self._create_response("已收到，正在判断...")
+        response["ticket"] = ticket
+        response["position"] = admission.position
+        response["eta"] = round(admission.wait, 1)
+        return response, admission
+
+    def speculate(self, speaker: str, content: str) -> bool:
+        """Start judging a question the player is still typing. Returns True if a model run started."""
+        if not self.game_state["running"]:
+            return False
+        if self._speculator is None:
+            with _CONDITION_INIT_LOCK:
+                if self._speculator is None:
+                    self._speculator = Speculator()
+        game_id = self.game_state["game_id"]
+        deps = SoupState(**self.game_state)
+        return self._speculator.start(
+            speaker, game_id, content, lambda: self._judge(content, deps, speculative=True)
+        )
+
+    async def _speculated_judgment(self, game_id: int, content: str):
+        """Output of a speculation on this exact question, None if there is none or it failed"""
+        future = self._speculator.take(game_id, content) if self._speculator is not None else None
+        if future is None or future.cancelled():
+            return None
         try:
-            # Add user answer to chat
-            self.add_message(speaker, content)
-            
-            # Get AI evaluation
-            answer_result = self.answer_agent.run_sync(
-                content,
-                deps=SoupState(**self.game_state)
-            )
-            
-            # Check if correct
-            if answer_result.output.result == "正确":
-                correct_answer = self.game_state['current_soup']['answer']
-                response_msg = f"🎉 恭喜你，猜对了！汤底是：{correct_answer}"
-                
-                self.console.print(Text(response_msg, style="bold green"))
-                logger.info(f"Correct answer by {speaker}: {content}")
-                
-                self.add_message('主持人', response_msg)
-                # self.end_game()
-                
-            else:
-                reasoning = answer_result.output.reasoning
-                response_msg = "很遗憾，回答错误"
-                
-                full_msg = f"{response_msg}\n依据：{reasoning}"
-                self.console.print(Text(full_msg, style="bold yellow"))
-                logger.info(f"Wrong answer by {speaker}: {content}")
-                
-                self.add_message('主持人', response_msg)
-            
-            return self._create_response(response_msg)
-            
+            output = await asyncio.wrap_future(future)
         except Exception as e:
-            logger.error(f"Error in handle_answer: {e}")
-            return self._create_response("处理答案时出错，请重试")
-        
-        finally:
-            self.ai_running = False
+            logger.warning(f"Speculation failed, judging again: {e}")
+            return None
+        metrics.SPECULATIONS.inc(1, "reused")
+        # Counted and logged now that the question was really asked
+        metrics.VERDICTS.inc(1, "ask", "speculation")
+        log_traffic("ask", content, output.result)
+        return output
+
+    def _admit(self, speaker: str, content: str, pin_game_id: int = None) -> None:
+        # A newer draft must not cancel the speculation this question will reuse
+        if pin_game_id is not None and self._speculator is not None:
+            self._speculator.pin(pin_game_id, content)
+        self._add_pending(1)
+        self.add_message(speaker, content)
+
+    def _settled(self, future, pin_game_id: Optional[int], content: str) -> None:
+        self._add_pending(-1)
+        # Cancelled before it started: nobody will take its pinned speculation
+        if future.cancelled() and pin_game_id is not None and self._speculator is not None:
+            self._speculator.discard(pin_game_id, content)
+
+    async def _ask_async(
+        self, ticket: int, game_id: int, speaker: str, content: str, deps: SoupState, queued_at: float
+    ) -> str:
+        if not self._is_current_game(game_id):
+            if self._speculator is not None:
+                self._speculator.discard(game_id, content)
+            return "游戏已结束，本条未判断"
+        try:
+            output = await self._speculated_judgment(game_id, content)
+            if output is None:
+                output = await self._judge(content, deps, queued_at)
+        except Exception as e:
+            logger.error(f"Error in ask ticket #{ticket}: {e}")
+            msg = self._error_message(e, "处理问题时出错，请重试")
+            if self._is_current_game(game_id):
+                self.add_message('主持人', msg)
+            return msg
+
+        if not self._is_current_game(game_id):
+            logger.info(f"Ask ticket #{ticket} dropped: game #{game_id} is over")
+            return "游戏已结束，本条未判断"
+        with metrics.STAGE_SECONDS.time("ask", "publish"):
+            return self._publish_judgment(content, output)
+
+    async def _answer_async(
+        self, ticket: int, game_id: int, speaker: str, content: str, deps: SoupState, queued_at: float
+    ) -> str:
+        if not self._is_current_game(game_id):
+            return "游戏已结束，本条未判断"
+        try:
+            output = await self._evaluate(content, deps, queued_at)
+        except Exception as e:
+            logger.error(f"Error in answer ticket #{ticket}: {e}")
+            msg = self._error_message(e, "处理答案时出错，请重试")
+            if self._is_current_game(game_id):
+                self.add_message('主持人', msg)
+            return msg
+
+        if not self._is_current_game(game_id):
+            logger.info(f"Answer ticket #{ticket} dropped: game #{game_id} is over")
+            return "游戏已结束，本条未判断"
+        with metrics.STAGE_SECONDS.time("ans", "publish"):
+            return self._publish_answer(speaker, content, output, deps.current_soup)
+
+    @staticmethod
+    def _error_message(error: Exception, default: str) -> str:
+        """Player-facing message for a failed judgment"""
+        from soup.agents.resilience import CircuitOpenError, ModelDeadlineError
+
+        if isinstance(error, CircuitOpenError):
+            return "AI 服务暂时不可用，请稍后再试"
+        if isinstance(error, ModelDeadlineError):
+            return "AI 响应超时，请重试"
+        return default
+
+    def _is_current_game(self, game_id: int) -> bool:
+        # Another worker may have ended or restarted the game
+        self.sync()
+        return self.game_state["running"] and self.game_state["game_id"] == game_id
+
+    def _add_pending(self, delta: int) -> None:
+        """Track queued and running judgments; ai_running is set while any is pending"""
+        with _PENDING_LOCK:
+            self._pending += delta
+            self.ai_running = self._pending > 0
     
     # CLI interface
     def run(self, user_input: str) -> None:
         """Handle CLI input (for command-line interface)"""
+        from rich.text import Text
+
         cmd = user_input.strip().lower()
         
         # Start new game
         if cmd == "start":
-            self.start_new_game()
+            if not self.start_new_game():
+                self.console.print(Text("没有可用的题目", style="bold red"))
+                return
             question = self.game_state['current_soup']['question']
             self.console.print(Text(f"汤面：{question}", style="bold green"))
             return
@@ -0,0 +1,208 @@
+"""Write-ahead log and snapshots of game state
+
+Every state change is appended to the current WAL segment by a background
+writer, which fsyncs in batches so commands never wait on the disk. Every
+JOURNAL_SNAPSHOT_EVERY events the writer rotates the segment, writes a
+snapshot of all rooms and drops the segments it covers. On startup the
+snapshot is loaded and only the remaining segments are replayed.
+
+Snapshots are taken while games keep running, so replay is idempotent:
+events already reflected in a room's state are skipped.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List
+
+from soup.config import config, logger
+
+SNAPSHOT_FILE = "snapshot.json"
+SEGMENT_PATTERN = "wal-{:06d}.jsonl"
+
+
+def empty_state() -> Dict:
+    return {
+        "game_id": 0,
+        "running": False,
+        "current_soup": None,
+        "first_seq": 0,
+        "messages": [],
+    }
+
+
+def apply_event(rooms: Dict[str, Dict], event: Dict) -> None:
+    """Apply one journal event to plain room states, skipping events already applied"""
+    room_id, kind = event["room"], event["type"]
+
+    if kind == "drop":
+        rooms.pop(room_id, None)
+        return
+
+    state = rooms.setdefault(room_id, empty_state())
+    if kind == "reset":
+        rooms[room_id] = empty_state()
+
+    elif kind == "start":
+        if event["game_id"] > state["game_id"]:
+            state.update(
+                game_id=event["game_id"],
+                running=True,
+                current_soup=event["soup"],
+                first_seq=0,
+                messages=[],
+            )
+
+    elif kind == "end":
+        if event["game_id"] == state["game_id"]:
+            state.update(running=False, current_soup=None, first_seq=0, messages=[])
+
+    elif kind == "message":
+        if event["game_id"] != state["game_id"]:
+            return
+        next_seq = state["first_seq"] + len(state["messages"])
+        if event["seq"] < next_seq:
+            return
+        if event["seq"] > next_seq:
+            state["first_seq"], state["messages"] = event["seq"], []
+        state["messages"].append([event["sayer"], event["content"]])
+
+
+class GameJournal:
+    """Durable, append-only log of game events with periodic snapshots"""
+
+    def __init__(self, state_dir: str):
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+        self.fsync_interval = config.JOURNAL_FSYNC_MS / 1000
+        self.snapshot_every = config.JOURNAL_SNAPSHOT_EVERY
+
+        self._buffer: List[Dict] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self._file = None
+        self._segment = 0
+        self._since_snapshot = 0
+        self._snapshot_fn: Callable[[], Dict[str, Dict]] = None
+
+    # Recovery
+    def _segments(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.state_dir, "wal-*.jsonl")))
+
+    def recover(self) -> Dict[str, Dict]:
+        """Rebuild room states from the last snapshot plus the WAL tail"""
+        rooms: Dict[str, Dict] = {}
+        snapshot_path = os.path.join(self.state_dir, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "r", encoding="utf-8") as f:
+                rooms = json.load(f)["rooms"]
+
+        replayed = 0
+        for path in self._segments():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn write at the tail of the log after a crash
+                        logger.warning(f"Skipping incomplete journal line in {path}")
+                        break
+                    apply_event(rooms, event)
+                    replayed += 1
+
+        logger.info(f"Recovered {len(rooms)} rooms ({replayed} events replayed)")
+        return rooms
+
+    # Writing
+    def start(self, snapshot_fn: Callable[[], Dict[str, Dict]]) -> None:
+        """Start the background writer; `snapshot_fn` returns the state of every room"""
+        self._snapshot_fn = snapshot_fn
+        segments = self._segments()
+        if segments:
+            self._segment = int(os.path.basename(segments[-1])[4:10])
+        self._open_segment()
+        self._thread = threading.Thread(target=self._run, name="soup-journal", daemon=True)
+        self._thread.start()
+
+    def record(self, room_id: str, kind: str, **data) -> None:
+        """Queue an event; it is written and fsynced by the background writer"""
+        data["room"] = room_id
+        data["type"] = kind
+        with self._cond:
+            self._buffer.append(data)
+            self._cond.notify()
+
+    def close(self) -> None:
+        """Flush pending events and stop the writer"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _open_segment(self) -> None:
+        self._segment += 1
+        path = os.path.join(self.state_dir, SEGMENT_PATTERN.format(self._segment))
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._buffer or self._closed)
+                closed = self._closed
+
+            # Linger so events arriving close together share one fsync
+            if not closed:
+                time.sleep(self.fsync_interval)
+
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+
+            # Any failure is logged and the loop goes on: a dead writer would
+            # silently stop making events durable while games keep running
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception:
+                    logger.exception(f"Journal write of {len(batch)} events failed")
+
+            if self._since_snapshot >= self.snapshot_every:
+                try:
+                    self._snapshot()
+                except Exception:
+                    logger.exception("Journal snapshot failed")
+
+            if closed:
+                self._file.close()
+                return
+
+    def _write(self, batch: List[Dict]) -> None:
+        self._file.write("".join(json.dumps(event, ensure_ascii=False) + "\n" for event in batch))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._since_snapshot += len(batch)
+
+    def _snapshot(self) -> None:
+        # Events written so far are already applied to the live state, so once the
+        # snapshot is durable every closed segment can go
+        old_segments = self._segments()
+        # The new segment is opened first, so a failure leaves the writer on the old one
+        old_file = self._file
+        self._open_segment()
+        old_file.close()
+
+        rooms = self._snapshot_fn()
+        path = os.path.join(self.state_dir, SNAPSHOT_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"time": time.time(), "rooms": rooms}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        for segment in old_segments:
+            os.remove(segment)
+        self._since_snapshot = 0
+        logger.info(f"Journal snapshot written ({len(rooms)} rooms)")
@@ -0,0 +1,263 @@
+"""Low-overhead in-process metrics, exposed in Prometheus text format
+
+Counters and histograms are plain dicts of label tuples guarded by one lock
+each; an observation costs a bisect and a few increments, so they stay on in
+production. `render()` produces the /metrics payload.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Sequence, Tuple
+
+from soup.cache import puzzle_key
+
+# Seconds; covers local lookups (sub-millisecond) up to slow model calls
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+# Judgment kind and start time of the agent run in progress on this task,
+# so the model wrapper can tell how long prompt assembly took
+_current_run: ContextVar[list] = ContextVar("soup_current_run", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with positional label values"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(items)
+        ]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with positional label values"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *labels) -> "_Timer":
+        """Context manager observing the elapsed wall time of its block"""
+        return _Timer(self, labels)
+
+    def count(self, *labels) -> int:
+        entry = self._values.get(labels)
+        return entry[2] if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(entry[0]), entry[1], entry[2]) for labels, entry in self._values.items()]
+        lines = []
+        for labels, counts, total, count in sorted(items):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "soup_http_request_seconds", "Flask request handling time", ("route", "method", "status")
+)
+STAGE_SECONDS = registry.histogram(
+    "soup_stage_seconds",
+    "Time per judgment stage (queue_wait, local, prompt_build, model, publish)",
+    ("kind", "stage"),
+)
+MODEL_REQUEST_SECONDS = registry.histogram(
+    "soup_model_request_seconds", "Model round-trip time per request", ("model", "outcome")
+)
+MODEL_RETRIES = registry.counter(
+    "soup_model_retries_total", "Extra model requests caused by output validation retries", ("kind",)
+)
+VERDICTS = registry.counter(
+    "soup_verdicts_total", "Verdicts by where they came from", ("kind", "source")
+)
+MODEL_TOKENS = registry.counter(
+    "soup_model_tokens_total", "Tokens used per model", ("model", "type")
+)
+HEDGES = registry.counter(
+    "soup_model_hedges_total", "Hedged duplicate requests: sent, and which one answered first", ("model", "outcome")
+)
+DEADLINE_EXCEEDED = registry.counter(
+    "soup_model_deadline_exceeded_total", "Model requests that ran past MODEL_DEADLINE", ("model",)
+)
+CIRCUIT_OPENED = registry.counter(
+    "soup_circuit_opened_total", "Times a model's circuit breaker opened", ("model",)
+)
+CIRCUIT_REJECTED = registry.counter(
+    "soup_circuit_rejected_total", "Requests failed fast because the circuit was open", ("model",)
+)
+CASCADE = registry.counter(
+    "soup_cascade_total", "Cascade outcomes: answered by the cheap model, or why it escalated", ("kind", "outcome")
+)
+CASCADE_DISAGREEMENTS = registry.counter(
+    "soup_cascade_disagreements_total", "Escalations where the strong model overruled the cheap one", ("kind", "reason")
+)
+RATE_LIMITED = registry.counter(
+    "soup_rate_limited_total", "Commands refused by the rate limiter, by limiting scope", ("scope",)
+)
+SPECULATIONS = registry.counter(
+    "soup_speculations_total", "Speculative judgments of drafts, by outcome", ("outcome",)
+)
+PUZZLE_TOKENS = registry.counter(
+    "soup_puzzle_tokens_total", "Tokens used per puzzle", ("puzzle", "type")
+)
+
+
+def render() -> str:
+    return registry.render()
+
+
+def start_run(kind: str) -> None:
+    """Mark the start of an agent run on the current task, for prompt_build timing"""
+    _current_run.set([kind, time.perf_counter()])
+
+
+def observe_prompt_build() -> None:
+    """Called at the first model request of a run: time since start_run is prompt assembly"""
+    run = _current_run.get()
+    if run is not None and run[1] is not None:
+        STAGE_SECONDS.observe(time.perf_counter() - run[1], run[0], "prompt_build")
+        run[1] = None
+
+
+def record_model_usage(model_name: str, usage) -> None:
+    """Add one model response's token usage to the per-model counters"""
+    MODEL_TOKENS.inc(usage.input_tokens, model_name, "input")
+    MODEL_TOKENS.inc(usage.output_tokens, model_name, "output")
+    if usage.cache_read_tokens:
+        MODEL_TOKENS.inc(usage.cache_read_tokens, model_name, "cache_read")
+
+
+def record_run_usage(kind: str, soup: Dict, usage, share: float = 1.0) -> None:
+    """Add an agent run's token usage to its puzzle, and count its retries"""
+    puzzle = puzzle_label(soup)
+    PUZZLE_TOKENS.inc(usage.input_tokens * share, puzzle, "input")
+    PUZZLE_TOKENS.inc(usage.output_tokens * share, puzzle, "output")
+    # Input tokens served from the provider's prompt prefix cache
+    if usage.cache_read_tokens:
+        PUZZLE_TOKENS.inc(usage.cache_read_tokens * share, puzzle, "cache_read")
+    if usage.requests > 1 and share == 1.0:
+        MODEL_RETRIES.inc(usage.requests - 1, kind)
+
+
+def puzzle_label(soup: Dict) -> str:
+    """Stable, bounded label for a puzzle: its library id, else its content key"""
+    if not soup:
+        return "none"
+    if soup.get("id") is not None:
+        return str(soup["id"])
+    return puzzle_key(soup)
@@ -0,0 +1,124 @@
+import atexit
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+from soup.config import config, logger
+from soup.game import SoupFlow, SoupResources
+from soup.journal import GameJournal
+from soup.shared import SharedGameStore
+
+DEFAULT_ROOM = "default"
+ROOM_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+
+class RoomManager:
+    """Creates, looks up and garbage-collects independent games by room ID"""
+
+    def __init__(self, resources: SoupResources = None):
+        # Agents and puzzles are shared, each room only keeps its own game state
+        self.resources = resources or SoupResources()
+        self._rooms: Dict[str, SoupFlow] = {}
+        self._lock = threading.RLock()
+        self._last_gc = time.monotonic()
+
+        # State shared by several server processes, which makes it durable too
+        self.shared = None
+        if config.SHARED_DB:
+            self.shared = SharedGameStore(config.SHARED_DB, config.CHAT_RETENTION)
+            if config.STATE_DIR:
+                logger.warning("SHARED_DB is set, the STATE_DIR journal is not used")
+
+        # Durable state: rebuild rooms from the journal, then keep logging changes
+        self.journal = None
+        if config.STATE_DIR and self.shared is None:
+            self.journal = GameJournal(config.STATE_DIR)
+            self._recover()
+            self.journal.start(self.snapshot_state)
+            atexit.register(self.journal.close)
+
+    def _recover(self) -> None:
+        for room_id, state in self.journal.recover().items():
+            # Attach the journal after restoring so recovery itself isn't logged
+            room = SoupFlow(self.resources, room_id)
+            room.restore(state)
+            room.journal = self.journal
+            self._rooms[room_id] = room
+
+    def snapshot_state(self) -> Dict[str, Dict]:
+        """State of every room, for journal snapshots"""
+        with self._lock:
+            rooms = list(self._rooms.items())
+        return {room_id: room.snapshot() for room_id, room in rooms}
+
+    def queue_stats(self) -> Dict[str, Dict]:
+        """Scheduler counters of the rooms with queued or running commands"""
+        with self._lock:
+            rooms = list(self._rooms.items())
+        return {
+            room_id: room.scheduler.stats() for room_id, room in rooms
+            if room.scheduler.queued or room.scheduler.running
+        }
+
+    def __len__(self) -> int:
+        return len(self._rooms)
+
+    @staticmethod
+    def is_valid_id(room_id: str) -> bool:
+        return isinstance(room_id, str) and bool(ROOM_ID_PATTERN.match(room_id))
+
+    def get(self, room_id: str = DEFAULT_ROOM, create: bool = True) -> Optional[SoupFlow]:
+        """Look up a room, creating it on first use. Returns None if unavailable."""
+        if not self.is_valid_id(room_id):
+            return None
+
+        self._maybe_collect()
+
+        room = self._rooms.get(room_id)
+        if room is None and create:
+            with self._lock:
+                room = self._rooms.get(room_id)
+                if room is None:
+                    if len(self._rooms) >= config.MAX_ROOMS:
+                        self.collect()
+                    if len(self._rooms) >= config.MAX_ROOMS:
+                        logger.warning(f"Room limit reached ({config.MAX_ROOMS}), rejecting room {room_id}")
+                        return None
+                    room = SoupFlow(self.resources, room_id, self.journal, self.shared)
+                    self._rooms[room_id] = room
+                    logger.info(f"Room {room_id} created ({len(self._rooms)} rooms)")
+
+        if room is not None:
+            room.touch()
+            # Pick up what other workers changed since this room was last used here
+            room.sync()
+        return room
+
+    def collect(self) -> int:
+        """Remove rooms idle for longer than ROOM_IDLE_TTL. Returns the number removed."""
+        cutoff = time.monotonic() - config.ROOM_IDLE_TTL
+        with self._lock:
+            idle = [
+                room_id for room_id, room in self._rooms.items()
+                if room.last_active < cutoff and not room.ai_running
+            ]
+            for room_id in idle:
+                del self._rooms[room_id]
+                if self.journal is not None:
+                    self.journal.record(room_id, "drop")
+            self._last_gc = time.monotonic()
+        if self.shared is not None:
+            self.shared.collect(config.ROOM_IDLE_TTL)
+
+        if idle:
+            logger.info(f"Collected {len(idle)} idle rooms ({len(self._rooms)} left)")
+        return len(idle)
+
+    def _maybe_collect(self) -> None:
+        if time.monotonic() - self._last_gc >= config.ROOM_GC_INTERVAL:
+            self.collect()
+
+    def reload(self) -> None:
+        """Reload shared resources; games in progress keep their puzzle and chat"""
+        self.resources.reload()
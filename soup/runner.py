@@ -0,0 +1,47 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine
+
+from soup.config import logger
+
+
+class AsyncRunner:
+    """Background asyncio event loop shared by the whole process
+
+    Model calls are coroutines; running them all on one loop lets a single
+    thread keep hundreds of judgments in flight.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    self._start()
+        return self._loop
+
+    def _start(self) -> None:
+        loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=loop.run_forever, name="soup-async-runner", daemon=True
+        )
+        self._thread.start()
+        self._loop = loop
+        logger.info("Async runner started")
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedule a coroutine on the loop and return a thread-safe future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: float = None) -> Any:
+        """Run a coroutine on the loop and block the calling thread for its result"""
+        return self.submit(coro).result(timeout)
+
+
+runner = AsyncRunner()
@@ -0,0 +1,171 @@
+"""Bounded per-room command queue
+
+Commands wait in one FIFO per speaker and free slots are handed out
+round-robin across speakers, so one chatty player can't starve the others.
+At most ROOM_PARALLELISM commands of a room run at once on the async runner.
+A full queue is refused with a retry-after estimate instead of growing
+without bound.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Callable, Coroutine, NamedTuple, Optional
+
+from soup.config import config
+from soup.runner import runner
+
+# Initial guess of one command's service time, until one has been measured
+DEFAULT_SERVICE_TIME = 3.0
+# Weight of the latest measurement in the service-time average
+SERVICE_TIME_ALPHA = 0.2
+
+
+class Admission(NamedTuple):
+    """Outcome of a submission: the result future, or None if the queue was full"""
+    future: Optional[Future]
+    position: int        # commands that will start before this one (0: started right away)
+    wait: float          # estimated seconds until it starts, or until a retry may succeed
+
+    @property
+    def accepted(self) -> bool:
+        return self.future is not None
+
+
+class RoomScheduler:
+    """FIFO per speaker, round-robin across speakers, bounded parallelism and capacity"""
+
+    __slots__ = ("_lock", "_queues", "_queued", "_running", "_service_time")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # speaker -> deque of [job, future]; dict order is the round-robin order.
+        # job is None until the command's on_admit has run.
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._queued = 0
+        self._running = 0
+        self._service_time = DEFAULT_SERVICE_TIME
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def submit(self, speaker: str, job: Callable[[], Coroutine], on_admit: Callable = None) -> Admission:
+        """Queue `job` (a coroutine factory) for `speaker`
+
+        `on_admit` runs once the command is accepted and before it can start:
+        the command holds its place in the queue but isn't dispatched until
+        `on_admit` returns.
+        """
+        parallelism = max(1, config.ROOM_PARALLELISM)
+        with self._lock:
+            own = self._queues.get(speaker)
+            own_ahead = len(own) if own else 0
+            if self._queued >= config.ROOM_QUEUE_MAX:
+                return Admission(None, self._queued, self._estimate(1, parallelism))
+            if own_ahead >= config.ROOM_QUEUE_PER_SPEAKER:
+                return Admission(None, own_ahead, self._estimate(self._ahead(speaker, 0) + 1, parallelism))
+
+            free = parallelism - self._running
+            position = max(0, self._ahead(speaker, own_ahead) - free + 1)
+            future = Future()
+            entry = [None, future]
+            if own is None:
+                own = self._queues[speaker] = deque()
+            own.append(entry)
+            self._queued += 1
+
+        try:
+            if on_admit is not None:
+                on_admit()
+        finally:
+            with self._lock:
+                entry[0] = job
+        self._dispatch()
+        return Admission(future, position, self._estimate(position, parallelism))
+
+    def accepting(self, speaker: str = None) -> bool:
+        """Whether a command of `speaker` would be admitted now"""
+        if self._queued >= config.ROOM_QUEUE_MAX:
+            return False
+        own = self._queues.get(speaker) if speaker is not None else None
+        return not own or len(own) < config.ROOM_QUEUE_PER_SPEAKER
+
+    def clear(self) -> int:
+        """Cancel every command that hasn't started, returning how many were dropped"""
+        with self._lock:
+            dropped = [future for queue in self._queues.values() for _, future in queue]
+            self._queues.clear()
+            self._queued = 0
+        for future in dropped:
+            future.cancel()
+        return len(dropped)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queued,
+            "running": self._running,
+            "speakers": len(self._queues),
+            "service_time": round(self._service_time, 3),
+        }
+
+    def _ahead(self, speaker: str, own_ahead: int) -> int:
+        """Queued commands that will be dispatched before the speaker's next one"""
+        ahead = own_ahead
+        before = True
+        for other, queue in self._queues.items():
+            if other == speaker:
+                before = False
+                continue
+            # Speakers earlier in the rotation get one more turn in the same round
+            ahead += min(len(queue), own_ahead + 1 if before else own_ahead)
+        return ahead
+
+    def _estimate(self, position: int, parallelism: int) -> float:
+        return position * self._service_time / parallelism
+
+    def _dispatch(self) -> None:
+        """Start queued commands while there are free slots"""
+        while True:
+            with self._lock:
+                if self._running >= max(1, config.ROOM_PARALLELISM):
+                    return
+                # First speaker in rotation whose next command is admitted
+                for speaker, queue in self._queues.items():
+                    if queue[0][0] is not None:
+                        break
+                else:
+                    return
+                job, future = queue.popleft()
+                if queue:
+                    self._queues.move_to_end(speaker)
+                else:
+                    del self._queues[speaker]
+                self._queued -= 1
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._running += 1
+
+            started = time.perf_counter()
+            task = runner.submit(job())
+            task.add_done_callback(
+                lambda done, future=future, started=started: self._finished(done, future, started)
+            )
+
+    def _finished(self, done: Future, future: Future, started: float) -> None:
+        with self._lock:
+            self._running -= 1
+            self._service_time += SERVICE_TIME_ALPHA * (
+                time.perf_counter() - started - self._service_time
+            )
+        if done.cancelled():
+            future.set_exception(RuntimeError("Command was cancelled"))
+        elif done.exception() is not None:
+            future.set_exception(done.exception())
+        else:
+            future.set_result(done.result())
+        self._dispatch()
@@ -0,0 +1,202 @@
+"""Game state shared by several server processes (SQLite in WAL mode)
+
+With SHARED_DB set, the authoritative state of every room (game ID, running
+flag, current puzzle and chat) lives in one SQLite database. Changes are
+single write transactions, so game IDs and chat sequence numbers are
+assigned atomically across workers. Each worker keeps its in-memory SoupFlow
+as a cache and pulls what other workers changed when the room's version
+moved (`SoupFlow.sync`). In WAL mode those reads never wait on writers.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    room_id TEXT PRIMARY KEY,
+    game_id INTEGER NOT NULL DEFAULT 0,
+    running INTEGER NOT NULL DEFAULT 0,
+    soup TEXT,
+    first_seq INTEGER NOT NULL DEFAULT 0,
+    next_seq INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    room_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    sayer TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (room_id, seq)
+) WITHOUT ROWID;
+"""
+
+# Seconds a writer waits for another worker's write transaction
+BUSY_TIMEOUT = 5.0
+# Versions follow the clock, so a room dropped and created again never
+# reuses a version a worker may still remember
+BUMP = "version = MAX(version + 1, ?)"
+
+
+def _stamp(room_id: str) -> tuple:
+    now = time.time()
+    return int(now * 1_000_000), now, room_id
+
+
+class SharedGameStore:
+    """Room states and chat logs in one SQLite database, one connection per thread"""
+
+    def __init__(self, path: str, retention: int = 0):
+        self.path = path
+        self.retention = retention
+        self._local = threading.local()
+        # executescript() manages its own transaction
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Transactions are managed explicitly (BEGIN IMMEDIATE for writes)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self):
+        return _Transaction(self._conn(), "BEGIN IMMEDIATE")
+
+    def _read(self):
+        # One snapshot for the whole read, even while other workers write
+        return _Transaction(self._conn(), "BEGIN")
+
+    @staticmethod
+    def _ensure(conn: sqlite3.Connection, room_id: str) -> None:
+        conn.execute(
+            "INSERT OR IGNORE INTO rooms (room_id, updated) VALUES (?, ?)", (room_id, time.time())
+        )
+
+    def version(self, room_id: str) -> int:
+        row = self._conn().execute("SELECT version FROM rooms WHERE room_id = ?", (room_id,)).fetchone()
+        return row[0] if row else -1
+
+    def changes(self, room_id: str, known_version: int, game_id: int, next_seq: int) -> Optional[Dict]:
+        """State newer than `known_version`, or None if unchanged
+
+        When the caller's game and cursor are still valid only the messages
+        from `next_seq` on are returned ("full": False); otherwise the whole
+        retained chat ("full": True).
+        """
+        with self._read() as conn:
+            row = conn.execute(
+                "SELECT game_id, running, soup, first_seq, next_seq, version FROM rooms WHERE room_id = ?",
+                (room_id,),
+            ).fetchone()
+            if row is None or row[5] == known_version:
+                return None
+            db_game_id, running, soup, first_seq, db_next_seq, version = row
+            full = db_game_id != game_id or not first_seq <= next_seq <= db_next_seq
+            messages = conn.execute(
+                "SELECT sayer, content FROM messages WHERE room_id = ? AND seq >= ? ORDER BY seq",
+                (room_id, first_seq if full else next_seq),
+            ).fetchall()
+        return {
+            "version": version,
+            "full": full,
+            "game_id": db_game_id,
+            "running": bool(running),
+            "current_soup": json.loads(soup) if soup else None,
+            "first_seq": first_seq,
+            "messages": messages,
+        }
+
+    def reset(self, room_id: str) -> None:
+        with self._write() as conn:
+            self._ensure(conn, room_id)
+            conn.execute("DELETE FROM messages WHERE room_id = ?", (room_id,))
+            conn.execute(
+                "UPDATE rooms SET game_id = 0, running = 0, soup = NULL, first_seq = 0, next_seq = 0, "
+                f"{BUMP}, updated = ? WHERE room_id = ?",
+                _stamp(room_id),
+            )
+
+    def touch(self, room_id: str) -> None:
+        """Create the room if no worker has used it yet"""
+        with self._write() as conn:
+            self._ensure(conn, room_id)
+
+    def start_game(self, room_id: str, soup: Dict) -> int:
+        """End whatever game is running and start a new one, returning its game ID"""
+        with self._write() as conn:
+            self._ensure(conn, room_id)
+            conn.execute("DELETE FROM messages WHERE room_id = ?", (room_id,))
+            conn.execute(
+                "UPDATE rooms SET game_id = game_id + 1, running = 1, soup = ?, first_seq = 0, "
+                f"next_seq = 0, {BUMP}, updated = ? WHERE room_id = ?",
+                (json.dumps(soup, ensure_ascii=False),) + _stamp(room_id),
+            )
+            return conn.execute("SELECT game_id FROM rooms WHERE room_id = ?", (room_id,)).fetchone()[0]
+
+    def end_game(self, room_id: str) -> None:
+        with self._write() as conn:
+            self._ensure(conn, room_id)
+            conn.execute("DELETE FROM messages WHERE room_id = ?", (room_id,))
+            conn.execute(
+                "UPDATE rooms SET running = 0, soup = NULL, first_seq = 0, next_seq = 0, "
+                f"{BUMP}, updated = ? WHERE room_id = ?",
+                _stamp(room_id),
+            )
+
+    def append_message(self, room_id: str, game_id: int, sayer: str, content: str) -> Optional[int]:
+        """Append to the chat of game `game_id`; None if another game has started meanwhile"""
+        with self._write() as conn:
+            self._ensure(conn, room_id)
+            current_game, first_seq, seq = conn.execute(
+                "SELECT game_id, first_seq, next_seq FROM rooms WHERE room_id = ?", (room_id,)
+            ).fetchone()
+            if current_game != game_id:
+                return None
+            conn.execute(
+                "INSERT INTO messages (room_id, seq, sayer, content) VALUES (?, ?, ?, ?)",
+                (room_id, seq, sayer, content),
+            )
+            if self.retention and seq + 1 - first_seq > self.retention:
+                first_seq = seq + 1 - self.retention
+                conn.execute("DELETE FROM messages WHERE room_id = ? AND seq < ?", (room_id, first_seq))
+            conn.execute(
+                f"UPDATE rooms SET first_seq = ?, next_seq = ?, {BUMP}, updated = ? WHERE room_id = ?",
+                (first_seq, seq + 1) + _stamp(room_id),
+            )
+            return seq
+
+    def collect(self, idle_ttl: float) -> int:
+        """Drop finished rooms no worker has changed for `idle_ttl` seconds"""
+        cutoff = time.time() - idle_ttl
+        with self._write() as conn:
+            idle = [
+                row[0] for row in
+                conn.execute("SELECT room_id FROM rooms WHERE running = 0 AND updated < ?", (cutoff,))
+            ]
+            for room_id in idle:
+                conn.execute("DELETE FROM messages WHERE room_id = ?", (room_id,))
+                conn.execute("DELETE FROM rooms WHERE room_id = ?", (room_id,))
+        return len(idle)
+
+
+class _Transaction:
+    """BEGIN on enter, COMMIT or ROLLBACK on exit"""
+
+    __slots__ = ("conn", "begin")
+
+    def __init__(self, conn: sqlite3.Connection, begin: str):
+        self.conn = conn
+        self.begin = begin
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute(self.begin)
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
@@ -0,0 +1,111 @@
+"""Speculative judging of questions while players are still typing
+
+The web UI sends debounced drafts of the question being typed. Each draft
+starts a background judgment keyed by its normalized text, so when the
+question is submitted its verdict is often already known or on its way. A
+player's newer draft cancels their older one that is still running. Only
+SPECULATION_MAX_INFLIGHT speculations run at once per process: drafts beyond
+that are dropped, never queued ahead of real questions.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Coroutine, Dict, Optional, Set, Tuple
+
+from soup import metrics
+from soup.cache import normalize_question
+from soup.config import config
+from soup.runner import runner
+
+# Speculations running in this process, across rooms
+_inflight = 0
+_inflight_lock = threading.Lock()
+
+
+def _finished(future: Future) -> None:
+    global _inflight
+    with _inflight_lock:
+        _inflight -= 1
+
+
+class Speculator:
+    """Speculative judgments of one room's drafts, keyed by (game ID, normalized text)"""
+
+    __slots__ = ("_lock", "_entries", "_drafts", "_pinned")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> future of the judgment, oldest first
+        self._entries: "OrderedDict[Tuple[int, str], Future]" = OrderedDict()
+        # speaker -> key of their latest draft
+        self._drafts: Dict[str, Tuple[int, str]] = {}
+        # Keys of submitted questions: their judgments must not be cancelled
+        self._pinned: Set[Tuple[int, str]] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def start(self, speaker: str, game_id: int, content: str, job: Callable[[], Coroutine]) -> bool:
+        """Judge a draft in the background unless it is already known. Returns True if started."""
+        global _inflight
+        key = (game_id, normalize_question(content))
+        with self._lock:
+            if key in self._entries:
+                self._drafts[speaker] = key
+                return False
+            self._cancel(self._drafts.pop(speaker, None))
+            with _inflight_lock:
+                if _inflight >= config.SPECULATION_MAX_INFLIGHT:
+                    metrics.SPECULATIONS.inc(1, "busy")
+                    return False
+                _inflight += 1
+            future = runner.submit(job())
+            future.add_done_callback(_finished)
+            self._entries[key] = future
+            self._drafts[speaker] = key
+            # Forget the oldest drafts nobody submitted
+            while len(self._entries) > max(1, config.SPECULATION_MAX_DRAFTS):
+                oldest = next((key for key in self._entries if key not in self._pinned), None)
+                if oldest is None:
+                    break
+                self._cancel(oldest)
+        metrics.SPECULATIONS.inc(1, "started")
+        return True
+
+    def pin(self, game_id: int, content: str) -> None:
+        """Keep the judgment of an admitted question alive until `take` or `discard`"""
+        key = (game_id, normalize_question(content))
+        with self._lock:
+            if key in self._entries:
+                self._pinned.add(key)
+
+    def take(self, game_id: int, content: str) -> Optional[Future]:
+        """Remove and return the judgment of a submitted question, None if there is none"""
+        key = (game_id, normalize_question(content))
+        with self._lock:
+            self._pinned.discard(key)
+            return self._entries.pop(key, None)
+
+    def discard(self, game_id: int, content: str) -> None:
+        """Drop the judgment of a question that won't be judged after all"""
+        future = self.take(game_id, content)
+        if future is not None and future.cancel():
+            metrics.SPECULATIONS.inc(1, "cancelled")
+
+    def clear(self) -> None:
+        """Cancel every speculation when the game ends, pinned ones included
+
+        Questions of the ended game are never judged, so nobody takes their pins.
+        """
+        with self._lock:
+            self._pinned.clear()
+            for key in list(self._entries):
+                self._cancel(key)
+            self._drafts.clear()
+
+    def _cancel(self, key: Optional[Tuple[int, str]]) -> None:
+        if key is None or key in self._pinned:
+            return
+        future = self._entries.pop(key, None)
+        if future is not None and future.cancel():
+            metrics.SPECULATIONS.inc(1, "cancelled")
@@ -0,0 +1,375 @@
+"""SQLite-backed puzzle store
+
+Puzzle bodies stay in SQLite; only an array of row IDs per filter is kept in
+memory, so picking a puzzle is a constant-time index into that array plus a
+primary-key lookup. Each room walks its own no-repeat permutation of the
+array (see `Deck`), which costs a handful of integers per room.
+"""
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from soup.config import config, logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS puzzles (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL UNIQUE,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    tags TEXT NOT NULL DEFAULT '',
+    difficulty INTEGER
+);
+CREATE INDEX IF NOT EXISTS puzzles_difficulty ON puzzles (difficulty);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Staging table of a file being synced, diffed against the puzzles by digest
+INCOMING_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS incoming (
+    digest TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    difficulty INTEGER
+)
+"""
+
+IMPORT_BATCH = 1000
+# Filters whose row IDs are kept in memory (least recently used dropped first)
+IDS_CACHE_SIZE = 256
+
+
+def puzzle_digest(question: str, answer: str) -> str:
+    return hashlib.sha1(f"{question}\0{answer}".encode("utf-8")).hexdigest()
+
+
+def iter_json_array(f, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    """Yield the elements of a top-level JSON array without reading the whole file"""
+    decoder = json.JSONDecoder()
+    buf, pos = "", 0
+    started = False
+    eof = False
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf, pos = chunk, 0
+            continue
+
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("Expected a JSON array of puzzles")
+            started = True
+            pos += 1
+            continue
+
+        if buf[pos] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Element spans the chunk boundary: read more and retry
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+
+        yield item
+        pos = end
+
+
+def iter_puzzle_file(path: str) -> Iterator[Dict]:
+    """Stream puzzles from a .json array or a .jsonl file"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(f)
+
+
+def _escape_like(text: str) -> str:
+    """Match `text` literally in a LIKE pattern with ESCAPE '\\'"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class Deck:
+    """No-repeat shuffle over range(size) in O(1) memory
+
+    A keyed Feistel network permutes [0, 4**k) and cycle-walking restricts it
+    to [0, size), so every index is dealt exactly once per round.
+    """
+
+    __slots__ = ("size", "key", "seed", "pos", "bits", "half_mask", "last", "deferred")
+
+    def __init__(self, size: int, key=None):
+        self.size = size
+        self.key = key
+        self.last = None
+        self.deferred = None
+        self.reshuffle()
+
+    def reshuffle(self) -> None:
+        self.seed = random.getrandbits(64)
+        self.pos = 0
+        half_bits = max(1, (max(self.size - 1, 1).bit_length() + 1) // 2)
+        self.bits = half_bits
+        self.half_mask = (1 << half_bits) - 1
+
+    def _permute(self, i: int) -> int:
+        left, right = i >> self.bits, i & self.half_mask
+        for round_ in range(4):
+            left, right = right, left ^ (hash((self.seed, round_, right)) & self.half_mask)
+        return (left << self.bits) | right
+
+    def deal(self) -> int:
+        """Next index of the permutation, reshuffling after a full round"""
+        if self.pos >= self.size:
+            if self.deferred is not None:
+                i, self.deferred = self.deferred, None
+                self.last = i
+                return i
+            self.reshuffle()
+        i = self._next()
+        # A new round must not start with the puzzle that ended the last one:
+        # it is dealt at the end of this round instead
+        if i == self.last and self.size > 1:
+            self.deferred = i
+            i = self._next()
+        self.last = i
+        return i
+
+    def _next(self) -> int:
+        if self.pos >= self.size:
+            self.reshuffle()
+        i = self._permute(self.pos)
+        while i >= self.size:
+            i = self._permute(i)
+        self.pos += 1
+        return i
+
+
+class PuzzleStore:
+    """Puzzle library in SQLite with streaming import and constant-time selection"""
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # Filter key -> row IDs, loaded on demand, guarded by self._lock
+        self._ids: "OrderedDict[Tuple, array]" = OrderedDict()
+        # Source signature the cached row IDs reflect
+        self._source = None
+
+    @classmethod
+    def from_config(cls) -> "PuzzleStore":
+        """Open the configured store and sync it with the configured puzzle file"""
+        store = cls(config.SOUP_DB)
+        store.sync_file(config.SOUP_FILE)
+        return store
+
+    def __len__(self) -> int:
+        return len(self.ids())
+
+    # Import
+    def sync_file(self, path: str) -> Optional[Dict[str, int]]:
+        """Apply the changes made to the puzzle file since the last import
+
+        Returns the number of puzzles added, removed and updated, or None if
+        the file is unchanged, missing or invalid.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            logger.error(f"Soups file not found: {path}")
+            return None
+
+        signature = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        if self._get_meta("source") == signature:
+            # Another process may have applied it to a shared SOUP_DB
+            if self._source != signature:
+                self._source = signature
+                with self._lock:
+                    self._ids.clear()
+            logger.info(f"Puzzle store up to date ({len(self)} puzzles)")
+            return None
+
+        try:
+            changes = self.replace_puzzles(iter_puzzle_file(path))
+        except (ValueError, json.JSONDecodeError) as e:
+            logger.error(f"Invalid puzzle file {path}: {e}")
+            return None
+        self._set_meta("source", signature)
+        self._source = signature
+        logger.info(
+            f"Synced puzzles from {path}: {changes['added']} added, "
+            f"{changes['removed']} removed, {changes['updated']} updated ({len(self)} puzzles)"
+        )
+        return changes
+
+    def import_puzzles(self, puzzles: Iterable[Dict]) -> int:
+        """Insert puzzles in batches, skipping duplicates. Returns the number of rows added.
+
+        The import is one transaction, so a broken file leaves the store untouched.
+        """
+        added = 0
+        with self._lock, self._conn:
+            for batch in self._batches(puzzles):
+                added += self._insert(batch)
+            self._ids.clear()
+        return added
+
+    def replace_puzzles(self, puzzles: Iterable[Dict]) -> Dict[str, int]:
+        """Make the store hold exactly `puzzles`, keeping the row IDs of those already in it
+
+        Puzzles are matched by digest: new ones are added, missing ones deleted
+        and changed tags or difficulty updated in place, in one transaction.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(INCOMING_SCHEMA)
+            self._conn.execute("DELETE FROM temp.incoming")
+            for batch in self._batches(puzzles):
+                self._insert(batch, "temp.incoming")
+            removed = self._conn.execute(
+                "DELETE FROM puzzles WHERE digest NOT IN (SELECT digest FROM temp.incoming)"
+            ).rowcount
+            updated = self._conn.execute(
+                "UPDATE puzzles SET tags = new.tags, difficulty = new.difficulty "
+                "FROM temp.incoming AS new WHERE puzzles.digest = new.digest "
+                "AND (puzzles.tags != new.tags OR puzzles.difficulty IS NOT new.difficulty)"
+            ).rowcount
+            # File order, like a fresh import
+            added = self._conn.execute(
+                "INSERT OR IGNORE INTO puzzles (digest, question, answer, tags, difficulty) "
+                "SELECT digest, question, answer, tags, difficulty FROM temp.incoming ORDER BY rowid"
+            ).rowcount
+            self._conn.execute("DELETE FROM temp.incoming")
+            if added or removed or updated:
+                self._ids.clear()
+        return {"added": added, "removed": removed, "updated": updated}
+
+    def _batches(self, puzzles: Iterable[Dict]) -> Iterator[list]:
+        batch = []
+        for puzzle in puzzles:
+            row = self._to_row(puzzle)
+            if row is not None:
+                batch.append(row)
+            if len(batch) >= IMPORT_BATCH:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _to_row(puzzle: Dict) -> Optional[tuple]:
+        question = str(puzzle.get("question", "")).strip()
+        answer = str(puzzle.get("answer", "")).strip()
+        if not question or not answer:
+            logger.warning("Skipping puzzle without question or answer")
+            return None
+        tags = puzzle.get("tags") or []
+        if isinstance(tags, str):
+            tags = [tags]
+        # Stored as ",a,b," so a tag can be matched with LIKE '%,a,%'
+        tags = f",{','.join(tags)}," if tags else ""
+        return (puzzle_digest(question, answer), question, answer, tags, puzzle.get("difficulty"))
+
+    def _insert(self, rows: list, table: str = "puzzles") -> int:
+        cursor = self._conn.executemany(
+            f"INSERT OR IGNORE INTO {table} (digest, question, answer, tags, difficulty) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        return cursor.rowcount
+
+    # Selection
+    def ids(self, tags: Tuple[str, ...] = (), difficulty: int = None) -> array:
+        """Row IDs of puzzles matching the filter (all tags must match)"""
+        key = (tuple(sorted(tags)), difficulty)
+        with self._lock:
+            ids = self._ids.get(key)
+            if ids is not None:
+                self._ids.move_to_end(key)
+                return ids
+            sql, params = "SELECT id FROM puzzles WHERE 1=1", []
+            for tag in key[0]:
+                sql += " AND tags LIKE ? ESCAPE '\\'"
+                params.append(f"%,{_escape_like(tag)},%")
+            if difficulty is not None:
+                sql += " AND difficulty = ?"
+                params.append(difficulty)
+            rows = self._conn.execute(sql + " ORDER BY id", params)
+            ids = self._ids[key] = array("q", (row[0] for row in rows))
+            # Filters come from clients: keep only the recently used ones
+            if len(self._ids) > IDS_CACHE_SIZE:
+                self._ids.popitem(last=False)
+        return ids
+
+    def get(self, puzzle_id: int) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, question, answer, tags, difficulty FROM puzzles WHERE id = ?",
+                (puzzle_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "question": row["question"],
+            "answer": row["answer"],
+            "tags": [tag for tag in row["tags"].split(",") if tag],
+            "difficulty": row["difficulty"],
+        }
+
+    def pick(self, deck: Optional[Deck], tags: Tuple[str, ...] = (), difficulty: int = None) -> Tuple[Optional[Dict], Deck]:
+        """Deal the next puzzle for a room; returns the puzzle and the (possibly new) deck"""
+        ids = self.ids(tags, difficulty)
+        key = (tuple(sorted(tags)), difficulty)
+        if deck is None or deck.key != key or deck.size != len(ids):
+            deck = Deck(len(ids), key)
+        if not ids:
+            return None, deck
+        return self.get(ids[deck.deal()]), deck
+
+    def __iter__(self) -> Iterator[Dict]:
+        """Iterate over all puzzles without loading them at once"""
+        for puzzle_id in self.ids():
+            puzzle = self.get(puzzle_id)
+            if puzzle is not None:
+                yield puzzle
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+            )
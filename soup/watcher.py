@@ -0,0 +1,64 @@
+"""Hot reload: polls the configuration and puzzle files for changes
+
+Every RELOAD_WATCH_INTERVAL seconds the watched files are stat()ed and their
+(mtime, size) compared with the last poll. A change is applied once the file
+has stayed the same for one more interval, so a reload never reads a file an
+editor is still writing. Each server process runs its own watcher.
+"""
+import os
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from soup.config import logger
+
+
+def _signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FileWatcher:
+    """Calls `on_change` from a background thread when a watched file changed"""
+
+    def __init__(self, paths: Callable[[], Iterable[str]], on_change: Callable[[], None], interval: float):
+        # Re-evaluated on every poll: a reload may point the settings at other files
+        self.paths = paths
+        self.on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._seen = self._scan()
+        self._thread = threading.Thread(target=self._run, name="soup-reload-watch", daemon=True)
+
+    def _scan(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        return {path: _signature(path) for path in self.paths() if path}
+
+    def start(self) -> "FileWatcher":
+        self._thread.start()
+        logger.info(f"Watching {', '.join(self._seen)} for changes every {self.interval:g}s")
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        pending = None
+        while not self._stop.wait(self.interval):
+            current = self._scan()
+            if current == self._seen:
+                pending = None
+                continue
+            if current != pending:
+                # Still being written: wait until it holds still for an interval
+                pending = current
+                continue
+            changed = [path for path, signature in current.items() if self._seen.get(path) != signature]
+            logger.info(f"Changed on disk: {', '.join(changed)}, reloading")
+            try:
+                self.on_change()
+            except Exception:
+                logger.exception("Hot reload failed")
+            pending = None
+            self._seen = self._scan()
@@ -1,9 +1,16 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify
 from werkzeug.middleware.proxy_fix import ProxyFix
+import json
 import logging
+import threading
+import time
 
-from soup.config import logger
-from soup.game import SoupFlow
+from soup import metrics
+from soup.agents.prompts import prompt_cache_stats
+from soup.config import config, logger
+from soup.rooms import DEFAULT_ROOM, RoomManager
+from soup.watcher import FileWatcher
+from soup.web.ratelimit import DraftBudget, RateLimiter
 
 
 # Configuration
@@ -11,14 +18,52 @@ class Config:
     HOST = "0.0.0.0"
     PORT = 42345
     MIN_CONTENT_LENGTH = 5
-    IGNORED_LOG_PATTERNS = ['post /update', 'get /update']
+    MAX_FILTER_TAGS = 8      # tags a new_game filter may combine
+    IGNORED_LOG_PATTERNS = ['post /update', 'get /update', 'get /events', 'get /metrics', 'post /draft']
+    # Server-Sent Events
+    SSE_HEARTBEAT = 15       # seconds between keep-alive comments on idle streams
+    SSE_MAX_AGE = 300        # seconds before a stream is closed so the client reconnects
+    SSE_RETRY_MS = 1000      # client reconnect delay
 
 
 # Custom Flask app with game state
 class SoupWebApp(Flask):
     def __init__(self, import_name):
         super().__init__(import_name)
-        self.soup_flow = SoupFlow()
+        self._rooms = None
+        self._rooms_lock = threading.Lock()
+        self.limiter = RateLimiter()
+        self.draft_budget = DraftBudget()
+        self.watcher = None
+
+    @property
+    def rooms(self) -> RoomManager:
+        """Rooms and agents, created on first use so a pre-forking server can import the app first"""
+        if self._rooms is None:
+            with self._rooms_lock:
+                if self._rooms is None:
+                    self._rooms = RoomManager()
+                    # Started with the rooms, so every worker process runs its own
+                    if config.RELOAD_WATCH_INTERVAL > 0:
+                        self.watcher = FileWatcher(
+                            lambda: (config.ENV_FILE, config.SOUP_FILE), self.reload, config.RELOAD_WATCH_INTERVAL
+                        ).start()
+        return self._rooms
+
+    @rooms.setter
+    def rooms(self, rooms: RoomManager) -> None:
+        self._rooms = rooms
+
+    def reload(self) -> None:
+        """Apply configuration and puzzle changes without interrupting games"""
+        self.rooms.reload()
+        self.limiter.reload()
+        self.draft_budget.reload()
+
+    @property
+    def soup_flow(self):
+        """The default room, for single-game callers"""
+        return self.rooms.get(DEFAULT_ROOM)
 
 
 # Logging filter to reduce noise
@@ -45,27 +90,87 @@ app.wsgi_app = ProxyFix(
 logging.getLogger('werkzeug').addFilter(IgnoreHeartbeatFilter())
 
 
+# Request timing
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, route, request.method, response.status_code
+        )
+    return response
+
+
 # Helper functions
-def get_current_soup_question():
+def get_room(room_id):
+    """Resolve a room ID from the request, None if invalid or unavailable"""
+    return app.rooms.get(room_id or DEFAULT_ROOM)
+
+
+def get_current_soup_question(flow):
     """Extract current soup question safely"""
-    current_soup = app.soup_flow.game_state.get("current_soup")
+    current_soup = flow.game_state.get("current_soup")
     return current_soup['question'] if current_soup else None
 
 
-def get_new_chats(client_game_id, client_chat_id):
+def get_new_chats(flow, client_game_id, client_chat_id, until=None):
     """Get new chat messages based on client state"""
-    server_game_id = app.soup_flow.game_state["game_id"]
+    server_game_id = flow.game_state["game_id"]
     
-    # If game changed, send all chat history
+    # If game changed, send the retained chat history
     if client_game_id != server_game_id:
-        return app.soup_flow.chat_history
+        client_chat_id = 0
     
     # Otherwise, send only new messages
-    total_chats = len(app.soup_flow.chat_history)
-    if client_chat_id < total_chats:
-        return app.soup_flow.chat_history[client_chat_id:]
-    
-    return []
+    return [record.to_dict() for record in flow.chat_history.since(client_chat_id, until)]
+
+
+def get_game_info(flow, client_game_id, client_chat_id, speaker=None):
+    """Build the game state payload for a client cursor, with the advanced cursor"""
+    # Read the cursor first: messages appended meanwhile go out with the next update
+    next_chat_id = flow.chat_history.next_seq
+    new_chats = get_new_chats(flow, client_game_id, client_chat_id, until=next_chat_id)
+
+    info = {
+        "ai_running": flow.ai_running,
+        # Room in the queue for this speaker; overload is answered with 429 and Retry-After
+        "accepting": flow.scheduler.accepting(speaker),
+        "game_id": flow.game_state["game_id"],
+        "current_soup": get_current_soup_question(flow),
+        "new_chats": new_chats,
+        "chat_id": next_chat_id,
+    }
+    return info, next_chat_id
+
+
+def parse_event_cursor():
+    """Read the (game_id, chat_id) cursor from Last-Event-ID or the query string"""
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    if last_event_id:
+        try:
+            game_id, chat_id = last_event_id.split(":", 1)
+            return int(game_id), int(chat_id)
+        except ValueError:
+            pass
+
+    game_id = request.args.get("game_id", -1, type=int)
+    chat_id = request.args.get("chat_id", 0, type=int)
+    return game_id, chat_id
+
+
+def format_sse(data, event_id=None):
+    """Encode a payload as a single SSE message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
 
 
 def create_response(code=0, msg="", **kwargs):
@@ -105,10 +210,29 @@ def handel_reload():
 
     if cmd != "reload":
         return create_response(1, "Invalid command")
-    app.soup_flow.reload()
+    app.reload()
     return create_response(msg="Configuration reloaded")
 
 
+@app.route("/stats")
+def handle_stats():
+    """Report room and verdict cache counters"""
+    return create_response(
+        msg="Stats",
+        rooms=len(app.rooms),
+        queues=app.rooms.queue_stats(),
+        rate_limit_buckets=app.limiter.stats(),
+        verdict_cache=app.rooms.resources.verdict_cache.stats(),
+        prompt_cache=prompt_cache_stats(),
+    )
+
+
+@app.route("/metrics")
+def handle_metrics():
+    """Expose latency histograms and token counters in Prometheus text format"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/update", methods=["POST"])
 def handle_update():
     """Handle game state polling"""
@@ -122,22 +246,103 @@ def handle_update():
     
     if cmd != "get_info":
         return create_response(1, "Invalid command")
+
+    flow = get_room(req.get('room'))
+    if flow is None:
+        return create_response(1, "Invalid or unavailable room")
     
     # Get new chat messages
     client_game_id = req.get('game_id', -1)
     client_chat_id = req.get('chat_id', 0)
-    new_chats = get_new_chats(client_game_id, client_chat_id)
+    info, _ = get_game_info(flow, client_game_id, client_chat_id, req.get('speaker'))
     
     # Build response
-    return create_response(
-        msg="Info renewed",
-        ai_running=app.soup_flow.ai_running,
-        game_id=app.soup_flow.game_state["game_id"],
-        current_soup=get_current_soup_question(),
-        new_chats=new_chats
+    return create_response(msg="Info renewed", **info)
+
+
+@app.route("/events")
+def handle_events():
+    """Push game state changes as Server-Sent Events, resuming from the client cursor"""
+    client_game_id, client_chat_id = parse_event_cursor()
+    flow = get_room(request.args.get("room"))
+    if flow is None:
+        return create_response(1, "Invalid or unavailable room"), 404
+    speaker = request.args.get("speaker")
+
+    def stream():
+        game_id, chat_id = client_game_id, client_chat_id
+        last_ai_running = None
+        last_accepting = None
+        last_soup = None
+        version = None
+        deadline = time.monotonic() + Config.SSE_MAX_AGE
+
+        yield f"retry: {Config.SSE_RETRY_MS}\n\n"
+        while time.monotonic() < deadline:
+            if version is not None:
+                new_version = flow.wait_for_change(version, Config.SSE_HEARTBEAT)
+                # Watched rooms are kept alive
+                flow.touch()
+                if new_version == version:
+                    # Idle: a comment line keeps proxies from closing the stream
+                    yield ": keep-alive\n\n"
+                    continue
+            version = flow.version
+
+            info, next_chat_id = get_game_info(flow, game_id, chat_id, speaker)
+            changed = (
+                info["new_chats"]
+                or info["game_id"] != game_id
+                or info["ai_running"] != last_ai_running
+                or info["accepting"] != last_accepting
+                or info["current_soup"] != last_soup
+            )
+            if not changed:
+                continue
+
+            game_id, chat_id = info["game_id"], next_chat_id
+            last_ai_running, last_soup = info["ai_running"], info["current_soup"]
+            last_accepting = info["accepting"]
+            yield format_sse(info, event_id=f"{game_id}:{chat_id}")
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
     )
 
 
+@app.route("/draft", methods=["POST"])
+def handle_draft():
+    """Judge a question the player is still typing, so its verdict is ready on submit"""
+    is_valid, error = validate_request(['content'])
+    if not is_valid:
+        return create_response(1, error)
+    # Clients stop sending drafts when the server doesn't speculate
+    if not config.SPECULATION_ENABLED:
+        return create_response(1, "Speculation is disabled", enabled=False)
+
+    req = request.json
+    flow = get_room(req.get('room'))
+    if flow is None:
+        return create_response(1, "Invalid or unavailable room")
+    content = req['content'].strip()
+    if len(content) < Config.MIN_CONTENT_LENGTH:
+        return create_response(1, f"Content too short (minimum {Config.MIN_CONTENT_LENGTH} characters)")
+
+    # Every speculation may be wasted: a strict budget per player and IP bounds the spend
+    speaker = req.get('speaker', '匿名玩家')
+    retry_after, scope = app.draft_budget.acquire(req.get('room') or DEFAULT_ROOM, speaker, request.remote_addr)
+    if scope is not None:
+        metrics.SPECULATIONS.inc(1, "over_budget")
+        return create_response(1, "Draft budget exhausted", retry_after=retry_after), 429, {"Retry-After": str(retry_after)}
+
+    return create_response(msg="Draft received", speculating=flow.speculate(speaker, content))
+
+
 @app.route("/cmd", methods=["POST"])
 def handle_command():
     """Handle game commands"""
@@ -149,45 +354,78 @@ def handle_command():
     req = request.json
     cmd = req['cmd'].strip().lower()
     
-    logger.info(f"Command received: {cmd} - {req.get('content', '')[:50]}")
+    flow = get_room(req.get('room'))
+    if flow is None:
+        return create_response(1, "Invalid or unavailable room")
+
+    logger.info(f"Command received [{req.get('room') or DEFAULT_ROOM}]: {cmd} - {req.get('content', '')[:50]}")
     
-    # Handle new game command (allowed even when AI is running)
+    # Handle new game command (queued commands of the old game are dropped)
     if cmd == "new_game":
-        if app.soup_flow.ai_running:
-            return create_response(1, "AI is processing. Please wait.")
-        
-        app.soup_flow.start_new_game()
+        tags = req.get('tags') or ()
+        if isinstance(tags, str):
+            tags = (tags,)
+        difficulty = req.get('difficulty')
+        if (
+            not isinstance(tags, (list, tuple))
+            or len(tags) > Config.MAX_FILTER_TAGS
+            or not all(isinstance(tag, str) and "," not in tag for tag in tags)
+        ):
+            return create_response(
+                1, f"tags must be a list of at most {Config.MAX_FILTER_TAGS} strings without commas"
+            )
+        # bool is an int subclass, but never a difficulty
+        if difficulty is not None and (not isinstance(difficulty, int) or isinstance(difficulty, bool)):
+            return create_response(1, "difficulty must be an integer")
+        if not flow.start_new_game(tags=tuple(tags), difficulty=difficulty):
+            return create_response(1, "No puzzle matches the filter")
         return create_response(
             msg="New game started",
-            soup_question=get_current_soup_question()
+            soup_question=get_current_soup_question(flow)
         )
     
     # Check if game is running for other commands
-    if not app.soup_flow.game_state.get("running", False):
+    if not flow.game_state.get("running", False):
         return create_response(1, "No game is running. Start a new game first.")
     
-    # Check if AI is busy
-    if app.soup_flow.ai_running:
-        return create_response(1, "AI is processing. Please wait.")
-    
     # Handle end game command
     if cmd == "end_game":
-        app.soup_flow.end_game()
+        flow.end_game()
         return create_response(msg="Game ended")
-    
+
     # Handle ask/answer commands
     if cmd.startswith("ask") or cmd.startswith("ans"):
         # Validate content
         content = req.get('content', '').strip()
         if len(content) < Config.MIN_CONTENT_LENGTH:
             return create_response(1, f"Content too short (minimum {Config.MIN_CONTENT_LENGTH} characters)")
+
+        # Every command costs a model call: throttle per speaker, IP, room and server
+        retry_after, scope = app.limiter.acquire(
+            req.get('room') or DEFAULT_ROOM, req.get('speaker', '匿名玩家'), request.remote_addr
+        )
+        if scope is not None:
+            metrics.RATE_LIMITED.inc(1, scope)
+            logger.warning(f"Rate limited ({scope}): {request.remote_addr} {req.get('speaker', '匿名玩家')}")
+            return (
+                create_response(1, f"请求过于频繁，请 {retry_after} 秒后再试", retry_after=retry_after),
+                429,
+                {"Retry-After": str(retry_after)},
+            )
         
         # Route to appropriate handler
-        if cmd.startswith("ask"):
-            result = app.soup_flow.handle_ask(req)
+        if config.ASYNC_MODE:
+            handler = flow.submit_ask if cmd.startswith("ask") else flow.submit_answer
         else:
-            result = app.soup_flow.handle_answer(req)
+            handler = flow.handle_ask if cmd.startswith("ask") else flow.handle_answer
+        result = handler(req)
         
+        # Full queue: the command never ran, so it doesn't count against the limits
+        if "retry_after" in result:
+            app.limiter.refund(
+                req.get('room') or DEFAULT_ROOM, req.get('speaker', '匿名玩家'), request.remote_addr
+            )
+            return jsonify(result), 429, {"Retry-After": str(result["retry_after"])}
         return jsonify(result)
     
     # Unknown command
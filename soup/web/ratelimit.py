@@ -0,0 +1,155 @@
+"""Token-bucket rate limiting for player commands
+
+Buckets are kept per scope (speaker in a room, client IP, room, whole server)
+in insertion-ordered dicts: a hit refills and moves one bucket to the end, and
+buckets idle long enough to be full again are dropped from the front, so both
+updates and expiry are O(1) amortized.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from soup.config import config
+
+
+def parse_limit(spec: str) -> Optional[Tuple[float, float]]:
+    """'COUNT/SECONDS' -> (burst, tokens per second); empty or 0 disables"""
+    if not spec:
+        return None
+    count, _, seconds = spec.partition("/")
+    count, seconds = float(count), float(seconds or 1)
+    if count <= 0 or seconds <= 0:
+        return None
+    return count, count / seconds
+
+
+class TokenBuckets:
+    """Buckets of one scope sharing a burst size and refill rate"""
+
+    __slots__ = ("burst", "rate", "idle_ttl", "_buckets")
+
+    def __init__(self, burst: float, rate: float):
+        self.burst = burst
+        self.rate = rate
+        # An untouched bucket is full again after this long and can be forgotten
+        self.idle_ttl = burst / rate
+        # key -> [tokens, last update]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def peek(self, key: str, now: float) -> float:
+        """Tokens available to `key` at `now`"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        return min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+    def take(self, key: str, tokens: float, now: float) -> None:
+        self._buckets[key] = [tokens - 1, now]
+        self._buckets.move_to_end(key)
+
+    def give_back(self, key: str, now: float) -> None:
+        """Return a token taken for a command that was not run after all"""
+        if key in self._buckets:
+            self._buckets[key] = [min(self.burst, self.peek(key, now) + 1), now]
+            self._buckets.move_to_end(key)
+
+    def expire(self, now: float) -> None:
+        buckets = self._buckets
+        while buckets:
+            key, bucket = next(iter(buckets.items()))
+            if now - bucket[1] < self.idle_ttl:
+                break
+            del buckets[key]
+
+
+class RateLimiter:
+    """Admits a command only if every scope it belongs to has a token left"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reload()
+
+    def limits(self) -> Dict[str, Optional[Tuple[float, float]]]:
+        """Configured (burst, rate) per scope, None for unlimited"""
+        return {
+            "speaker": parse_limit(config.RATE_LIMIT_SPEAKER),
+            "ip": parse_limit(config.RATE_LIMIT_IP),
+            "room": parse_limit(config.RATE_LIMIT_ROOM),
+            "global": parse_limit(config.RATE_LIMIT_GLOBAL),
+        }
+
+    def reload(self) -> None:
+        """Rebuild the buckets of the scopes whose configured limit changed"""
+        limits = self.limits()
+        with self._lock:
+            old = getattr(self, "_scopes", {})
+            scopes: Dict[str, TokenBuckets] = {}
+            for scope, limit in limits.items():
+                if not limit:
+                    continue
+                buckets = old.get(scope)
+                # Unchanged limits keep their buckets: a reload doesn't refill everyone
+                if buckets is None or (buckets.burst, buckets.rate) != limit:
+                    buckets = TokenBuckets(*limit)
+                scopes[scope] = buckets
+            self._scopes = scopes
+
+    def acquire(self, room_id: str, speaker: str, ip: str) -> Tuple[float, Optional[str]]:
+        """Take one token from each scope: (0, None) if admitted, else (retry_after, scope)"""
+        now = time.monotonic()
+        with self._lock:
+            scopes = self._scopes
+            checked: List[tuple] = []
+            retry_after, limited = 0.0, None
+            for scope, key in self._keys(room_id, speaker, ip):
+                buckets = scopes.get(scope)
+                if buckets is None:
+                    continue
+                buckets.expire(now)
+                tokens = buckets.peek(key, now)
+                if tokens < 1:
+                    wait = (1 - tokens) / buckets.rate
+                    if wait > retry_after:
+                        retry_after, limited = wait, scope
+                checked.append((buckets, key, tokens))
+            if limited is not None:
+                return math.ceil(retry_after), limited
+            # All scopes agree: only now spend the tokens
+            for buckets, key, tokens in checked:
+                buckets.take(key, tokens, now)
+        return 0, None
+
+    def refund(self, room_id: str, speaker: str, ip: str) -> None:
+        """Give back the tokens of an admitted command that was rejected later, e.g. by a full queue"""
+        now = time.monotonic()
+        with self._lock:
+            for scope, key in self._keys(room_id, speaker, ip):
+                buckets = self._scopes.get(scope)
+                if buckets is not None:
+                    buckets.give_back(key, now)
+
+    @staticmethod
+    def _keys(room_id: str, speaker: str, ip: str) -> Tuple[Tuple[str, str], ...]:
+        return (
+            ("speaker", f"{room_id}\0{speaker}"),
+            ("ip", ip or "-"),
+            ("room", room_id),
+            ("global", ""),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {scope: len(buckets) for scope, buckets in self._scopes.items()}
+
+
+class DraftBudget(RateLimiter):
+    """Speculative judgments each player and client IP may start (SPECULATION_BUDGET)"""
+
+    def limits(self) -> Dict[str, Optional[Tuple[float, float]]]:
+        budget = parse_limit(config.SPECULATION_BUDGET)
+        return {"speaker": budget, "ip": budget}
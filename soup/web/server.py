@@ -0,0 +1,92 @@
+"""Pre-forking production server
+
+The parent binds the listening socket and forks WEB_WORKERS processes that
+all accept on it. Each worker is a threaded WSGI server with its own agents,
+async runner and connection pool, so throughput scales with cores. Game state
+lives in SHARED_DB (see soup.shared), so any worker can serve any room. The
+parent restarts workers that die and stops them all on SIGTERM or SIGINT.
+"""
+import os
+import signal
+import socket
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from soup.config import config, logger
+
+# Pending connections the shared socket holds while every worker is busy
+LISTEN_BACKLOG = 1024
+# A worker dying sooner than this after its start is restarted only after a pause
+MIN_WORKER_LIFETIME = 5.0
+
+
+def serve(app, host: str, port: int, workers: int) -> None:
+    """Serve `app` from `workers` forked processes until interrupted"""
+    if not config.SHARED_DB:
+        raise SystemExit("SHARED_DB must be set to share game state between worker processes")
+
+    listener = socket.create_server((host, port), backlog=LISTEN_BACKLOG)
+    listener.set_inheritable(True)
+    logger.info(f"Starting Kame Soup server on {host}:{port} with {workers} workers")
+
+    children = {}  # pid -> start time
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        children[_spawn(app, host, port, listener)] = time.monotonic()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        logger.warning(f"Worker {pid} exited ({os.waitstatus_to_exitcode(status)}), restarting")
+        if time.monotonic() - started < MIN_WORKER_LIFETIME:
+            time.sleep(MIN_WORKER_LIFETIME)
+        if not stopping:
+            children[_spawn(app, host, port, listener)] = time.monotonic()
+    listener.close()
+    logger.info("Server stopped")
+
+
+def _spawn(app, host: str, port: int, listener: socket.socket) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+
+    # Worker: nothing above this point has started threads or opened connections
+    code = 0
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+        # shutdown() waits for serve_forever, so it can't run on the main thread
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        # Load agents and puzzles before taking the first request
+        app.rooms
+        logger.info(f"Worker {os.getpid()} ready")
+        server.serve_forever()
+    except BaseException as e:
+        logger.exception(f"Worker {os.getpid()} crashed: {e}")
+        code = 1
+    finally:
+        # Skip the parent's atexit handlers and buffered state
+        os._exit(code)
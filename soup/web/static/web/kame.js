@@ -2,15 +2,25 @@
 const CONFIG = {
     SERVER_URL: 'https://app.imgop.dedyn.io/game/soup',
     POLL_INTERVAL: 100,
-    UI_UPDATE_INTERVAL: 100
+    UI_UPDATE_INTERVAL: 100,
+    USE_SSE: true,
+    // Speculative judging: send the question being typed after this pause (ms)
+    SPECULATE: true,
+    DRAFT_DEBOUNCE: 600,
+    MIN_DRAFT_LENGTH: 5
 };
 
 // Application state
 const state = {
+    room: new URLSearchParams(window.location.search).get('room') || 'default',
     gameId: -1,
     chatFrom: 0,
     currentSoup: null,
-    isSending: false
+    aiRunning: false,
+    isSending: false,
+    speculate: CONFIG.SPECULATE,
+    draftTimer: null,
+    lastDraft: ''
 };
 
 // DOM elements cache
@@ -73,10 +83,11 @@ async function executeCommand(cmd, additionalData = {}) {
         return;
     }
 
-    const data = { cmd, ...additionalData };
+    const data = { cmd, room: state.room, ...additionalData };
     const response = await sendCommand('/cmd', data);
     
-    if (response) {
+    // A refused command (e.g. no puzzle matches) leaves the current game as it is
+    if (response && response.code === 0) {
         if (cmd === 'new_game') {
             state.currentSoup = response.soup_question;
         } else if (cmd === 'end_game') {
@@ -95,6 +106,8 @@ async function handleUserInput() {
     if (!userInput) return;
 
     elements.inputBox.value = '';
+    clearTimeout(state.draftTimer);
+    state.lastDraft = '';
 
     const inputType = elements.inputAsk.checked ? 'ask' : 'answer';
     const speaker = elements.playerName.value.trim() || '匿名玩家';
@@ -105,20 +118,40 @@ async function handleUserInput() {
     });
 }
 
-// Game state polling
-async function pollGameState() {
-    const data = {
-        cmd: 'get_info',
-        game_id: state.gameId,
-        chat_id: state.chatFrom
-    };
+// Speculative judging: the server starts judging a draft so the verdict is ready on submit
+function scheduleDraft() {
+    clearTimeout(state.draftTimer);
+    if (!state.speculate || !elements.inputAsk.checked || !state.currentSoup) return;
+    state.draftTimer = setTimeout(sendDraft, CONFIG.DRAFT_DEBOUNCE);
+}
 
-    const response = await sendCommand('/update', data);
-    if (!response) {
-        setTimeout(pollGameState, CONFIG.POLL_INTERVAL);
-        return;
+async function sendDraft() {
+    const content = elements.inputBox.value.trim();
+    if (content.length < CONFIG.MIN_DRAFT_LENGTH || content === state.lastDraft) return;
+    state.lastDraft = content;
+
+    try {
+        const response = await fetch(`${CONFIG.SERVER_URL}/draft`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                room: state.room,
+                speaker: elements.playerName.value.trim() || '匿名玩家',
+                content: content
+            })
+        });
+        const result = await response.json();
+        // Drafts are best effort and never shown; stop only if the server doesn't speculate
+        if (result.enabled === false) {
+            state.speculate = false;
+        }
+    } catch (error) {
+        console.error('Draft not sent:', error);
     }
+}
 
+// Game state updates
+function applyGameState(response) {
     // Check if game changed
     if (state.gameId !== response.game_id) {
         clearChat();
@@ -127,7 +160,8 @@ async function pollGameState() {
 
     // Update state
     state.gameId = response.game_id;
-    state.isSending = response.ai_running;
+    state.aiRunning = response.ai_running;
+    state.isSending = response.accepting === undefined ? response.ai_running : !response.accepting;
     state.currentSoup = response.current_soup || null;
 
     // Add new chat messages
@@ -137,6 +171,54 @@ async function pollGameState() {
         });
         state.chatFrom += response.new_chats.length;
     }
+    // Server cursor skips messages that fell out of the retention window
+    if (response.chat_id !== undefined) {
+        state.chatFrom = response.chat_id;
+    }
+}
+
+// Server push (SSE), falls back to polling when unavailable
+function subscribeGameState() {
+    if (!CONFIG.USE_SSE || typeof EventSource === 'undefined') {
+        pollGameState();
+        return;
+    }
+
+    const params = new URLSearchParams({
+        room: state.room,
+        speaker: elements.playerName.value.trim() || '匿名玩家',
+        game_id: state.gameId,
+        chat_id: state.chatFrom
+    });
+    const source = new EventSource(`${CONFIG.SERVER_URL}/events?${params}`);
+
+    source.onmessage = (event) => {
+        applyGameState(JSON.parse(event.data));
+    };
+
+    source.onerror = () => {
+        // The browser reconnects on its own; give up only if it stopped trying
+        if (source.readyState === EventSource.CLOSED) {
+            console.log('SSE unavailable, falling back to polling');
+            pollGameState();
+        }
+    };
+}
+
+// Game state polling
+async function pollGameState() {
+    const data = {
+        cmd: 'get_info',
+        room: state.room,
+        speaker: elements.playerName.value.trim() || '匿名玩家',
+        game_id: state.gameId,
+        chat_id: state.chatFrom
+    };
+
+    const response = await sendCommand('/update', data);
+    if (response) {
+        applyGameState(response);
+    }
 
     setTimeout(pollGameState, CONFIG.POLL_INTERVAL);
 }
@@ -144,7 +226,7 @@ async function pollGameState() {
 // UI updates
 function updateUI() {
     if (elements.thinking) {
-        elements.thinking.textContent = state.isSending ? '🤔' : '☺️';
+        elements.thinking.textContent = state.aiRunning ? '🤔' : '☺️';
     }
     
     elements.soupText.textContent = state.currentSoup || '当前无进行中的游戏';
@@ -168,6 +250,9 @@ function setupEventListeners() {
     // Send button
     elements.inputBtn.addEventListener('click', handleUserInput);
 
+    // Drafts while typing (speculative judging)
+    elements.inputBox.addEventListener('input', scheduleDraft);
+
     // Enter key in input box
     elements.inputBox.addEventListener('keydown', (e) => {
         if (e.key === 'Enter' && !e.shiftKey) {
@@ -180,7 +265,7 @@ function setupEventListeners() {
 // Initialize application
 function init() {
     setupEventListeners();
-    pollGameState();
+    subscribeGameState();
     setInterval(updateUI, CONFIG.UI_UPDATE_INTERVAL);
 }
 
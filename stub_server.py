@@ -0,0 +1,230 @@
+"""Local OpenAI-compatible chat-completions stub for load tests
+
+    python stub_server.py --port 8900 --latency lognormal:0.0,0.5 --error-rate 0.02
+    MODEL_BASE_URL=http://127.0.0.1:8900/v1/ python main.py
+
+Answers the agents' output tool with deterministic fake verdicts (see
+soup.agents.fake_model), after a latency drawn from the chosen distribution.
+Supports streaming and non-streaming responses. No tokens are spent.
+Like a provider's prefix cache, a repeated system prompt is reported as
+cached input tokens.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from soup.agents.fake_model import fake_output
+
+
+def parse_distribution(spec: str):
+    """Build a latency sampler (seconds) from 'fixed:S', 'uniform:A,B', 'normal:M,SD' or 'lognormal:MU,SIGMA'"""
+    kind, _, params = spec.partition(":")
+    values = [float(x) for x in params.split(",") if x]
+    rng = random.Random()
+    samplers = {
+        "fixed": lambda: values[0],
+        "uniform": lambda: rng.uniform(values[0], values[1]),
+        "normal": lambda: max(0.0, rng.gauss(values[0], values[1])),
+        "lognormal": lambda: rng.lognormvariate(values[0], values[1]),
+    }
+    if kind not in samplers:
+        raise argparse.ArgumentTypeError(f"Unknown latency distribution: {spec}")
+    return samplers[kind]
+
+
+class StubState:
+    def __init__(self, args):
+        self.latency = parse_distribution(args.latency)
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.token_interval = args.token_interval
+        self.correct_rate = args.correct_rate
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        # System prompts seen so far, oldest first
+        self.prefixes = {}
+
+
+# System prompts remembered for the emulated prefix cache
+PREFIX_CACHE_SIZE = 10000
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        state = self.state
+        with state.lock:
+            state.requests += 1
+        time.sleep(state.latency())
+
+        roll = random.random()
+        if roll < state.rate_limit_rate:
+            self._error(429, "Rate limit exceeded (stub)", {"Retry-After": "1"})
+            return
+        if roll < state.rate_limit_rate + state.error_rate:
+            self._error(500, "Internal error (stub)")
+            return
+
+        tools = request.get("tools") or []
+        if not tools:
+            self._error(400, "The stub only answers tool-output requests")
+            return
+        function = tools[0]["function"]
+        messages = request.get("messages", [])
+        prompt = next(
+            (_text(m.get("content")) for m in reversed(messages) if m.get("role") == "user"), ""
+        )
+        arguments = json.dumps(
+            fake_output(function.get("parameters", {}), prompt, state.correct_rate), ensure_ascii=False
+        )
+        usage = {
+            "prompt_tokens": sum(len(_text(m.get("content"))) for m in messages) // 2 + 1,
+            "completion_tokens": len(arguments) // 2 + 1,
+            "prompt_tokens_details": {"cached_tokens": self._cached_tokens(request)},
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        call = {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                "function": {"name": function["name"], "arguments": arguments}}
+        if request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+            self._stream(request.get("model", "stub"), call, usage if include_usage else None)
+        else:
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": None, "tool_calls": [call]},
+                    "finish_reason": "tool_calls",
+                }],
+                "usage": usage,
+            })
+
+    def _cached_tokens(self, request):
+        """Tokens of the leading system messages, if the same ones were sent before"""
+        prefix = []
+        for message in request.get("messages", []):
+            if message.get("role") != "system":
+                break
+            prefix.append(_text(message.get("content")))
+        if not prefix:
+            return 0
+        key = (request.get("model"), json.dumps(request.get("tools")), "\0".join(prefix))
+        prefixes = self.state.prefixes
+        with self.state.lock:
+            if key in prefixes:
+                return sum(len(text) for text in prefix) // 2
+            prefixes[key] = True
+            if len(prefixes) > PREFIX_CACHE_SIZE:
+                del prefixes[next(iter(prefixes))]
+        return 0
+
+    def _error(self, status, message, headers=None):
+        with self.state.lock:
+            self.state.errors += 1
+        self._send_json(status, {"error": {"message": message, "type": "stub_error"}}, headers)
+
+    def _stream(self, model, call, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        def send(choices, extra=None):
+            payload = {"id": chunk_id, "object": "chat.completion.chunk",
+                       "created": int(time.time()), "model": model, "choices": choices}
+            payload.update(extra or {})
+            self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        arguments = call["function"]["arguments"]
+        head = {"index": 0, "id": call["id"], "type": "function",
+                "function": {"name": call["function"]["name"], "arguments": ""}}
+        send([{"index": 0, "delta": {"role": "assistant", "tool_calls": [head]}, "finish_reason": None}])
+        for i in range(0, len(arguments), 8):
+            piece = {"index": 0, "function": {"arguments": arguments[i:i + 8]}}
+            send([{"index": 0, "delta": {"tool_calls": [piece]}, "finish_reason": None}])
+            if self.state.token_interval:
+                time.sleep(self.state.token_interval)
+        send([{"index": 0, "delta": {}, "finish_reason": "tool_calls"}])
+        if usage is not None:
+            send([], {"usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", default="fixed:0.5",
+                        help="fixed:S | uniform:A,B | normal:M,SD | lognormal:MU,SIGMA (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of 429 responses")
+    parser.add_argument("--token-interval", type=float, default=0.0,
+                        help="Delay between streamed chunks (seconds)")
+    parser.add_argument("--correct-rate", type=float, default=0.1,
+                        help="Fraction of answers judged 正确")
+    args = parser.parse_args()
+    parse_distribution(args.latency)
+
+    StubHandler.state = StubState(args)
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"Stub listening on http://{args.host}:{args.port}/v1/ (latency={args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state = StubHandler.state
+        print(f"Served {state.requests} requests, {state.errors} errors")
+
+
+if __name__ == "__main__":
+    main()
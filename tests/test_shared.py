@@ -0,0 +1,130 @@
+"""SharedGameStore seen from several connections, as the worker processes see it
+
+    python -m unittest discover tests
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from soup import shared
+from soup.shared import SharedGameStore
+
+SOUP = {"question": "汤面", "answer": "汤底"}
+
+
+class SharedGameStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "shared.db")
+        # Two stores are two independent connections, like two workers
+        self.a = SharedGameStore(self.path)
+        self.b = SharedGameStore(self.path)
+
+    def tearDown(self):
+        for store in (self.a, self.b):
+            store._conn().close()
+        self.tmpdir.cleanup()
+
+    def test_writer_waits_for_the_other_write_transaction(self):
+        self.a.start_game("room", SOUP)
+        appended = []
+        with self.a._write() as conn:
+            conn.execute("UPDATE rooms SET updated = updated WHERE room_id = 'room'")
+            writer = threading.Thread(
+                target=lambda: appended.append(self.b.append_message("room", 1, "p", "hi"))
+            )
+            writer.start()
+            time.sleep(0.2)
+            # BEGIN IMMEDIATE: the second writer is blocked, not interleaved
+            self.assertEqual(appended, [])
+        writer.join(5)
+        self.assertEqual(appended, [0])
+
+    def test_writer_gives_up_after_busy_timeout(self):
+        with mock.patch.object(shared, "BUSY_TIMEOUT", 0.05):
+            impatient = SharedGameStore(self.path)
+        with self.a._write():
+            with self.assertRaises(sqlite3.OperationalError):
+                impatient.touch("room")
+        # The failed transaction was rolled back: the connection is usable again
+        impatient.touch("room")
+        self.assertGreaterEqual(self.b.version("room"), 0)
+
+    def test_racing_appends_get_unique_sequence_numbers(self):
+        game_id = self.a.start_game("room", SOUP)
+        per_writer = 50
+        seqs = []
+
+        def append(store, sayer):
+            for i in range(per_writer):
+                seqs.append(store.append_message("room", game_id, sayer, f"{sayer}{i}"))
+
+        writers = [
+            threading.Thread(target=append, args=(store, name))
+            for store, name in ((self.a, "a"), (self.b, "b"))
+        ]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+
+        self.assertEqual(sorted(seqs), list(range(2 * per_writer)))
+        changes = self.b.changes("room", None, game_id, 0)
+        self.assertEqual(len(changes["messages"]), 2 * per_writer)
+
+    def test_versions_only_increase(self):
+        versions = [self.a.version("room")]
+        self.a.touch("room")
+        game_id = self.a.start_game("room", SOUP)
+        versions.append(self.b.version("room"))
+        for i in range(20):
+            (self.a if i % 2 else self.b).append_message("room", game_id, "p", str(i))
+            versions.append(self.a.version("room"))
+        self.b.end_game("room")
+        versions.append(self.a.version("room"))
+        self.assertEqual(versions, sorted(set(versions)))
+
+        # A dropped room that comes back never reuses a version a worker remembers
+        last = versions[-1]
+        with mock.patch("time.time", return_value=time.time() + 10):
+            self.assertEqual(self.a.collect(idle_ttl=1), 1)
+        self.assertEqual(self.b.version("room"), -1)
+        self.b.reset("room")
+        self.assertGreater(self.a.version("room"), last)
+
+    def test_stale_reader_catches_up(self):
+        game_id = self.a.start_game("room", SOUP)
+        self.a.append_message("room", game_id, "p", "first")
+        seen = self.b.changes("room", None, 0, 0)
+        self.assertTrue(seen["full"])
+        self.assertEqual(seen["messages"], [("p", "first")])
+
+        # Nothing new for a reader at the current version
+        self.assertIsNone(self.b.changes("room", seen["version"], game_id, 1))
+
+        self.a.append_message("room", game_id, "p", "second")
+        delta = self.b.changes("room", seen["version"], game_id, 1)
+        self.assertFalse(delta["full"])
+        self.assertEqual(delta["messages"], [("p", "second")])
+
+        # The other worker starts a new game: the stale reader gets everything again
+        new_game_id = self.a.start_game("room", SOUP)
+        self.assertEqual(new_game_id, game_id + 1)
+        restart = self.b.changes("room", delta["version"], game_id, 2)
+        self.assertTrue(restart["full"])
+        self.assertEqual(restart["game_id"], new_game_id)
+        self.assertEqual(restart["messages"], [])
+
+    def test_append_to_a_finished_game_is_refused(self):
+        game_id = self.a.start_game("room", SOUP)
+        self.b.start_game("room", SOUP)
+        self.assertIsNone(self.a.append_message("room", game_id, "p", "late verdict"))
+        self.assertEqual(self.b.changes("room", None, game_id + 1, 0)["messages"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()